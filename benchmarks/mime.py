@@ -0,0 +1,49 @@
+"""Сборка MIME-письма: каждый раз заново против подготовки один раз.
+
+Запуск из корня проекта::
+
+    python -m benchmarks.mime
+
+Сравнивает байты, которые SMTP-бэкенд получает на каждого получателя:
+``EmailMessage(...).message().as_bytes()`` и ``PreparedMessage.for_recipient``.
+"""
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mailing_project.settings')
+django.setup()
+
+from django.core.mail.message import sanitize_address  # noqa: E402
+
+from mailing_app.services import PreparedMessage, build_message  # noqa: E402
+
+RECIPIENTS = 20_000
+SUBJECT = 'Новое предложение для наших клиентов'
+BODY = 'Здравствуйте!\n\n' + 'Текст рассылки. ' * 60 + '\n\nС уважением, сервис рассылок'
+
+
+def build_each_time(emails):
+    for email in emails:
+        build_message(SUBJECT, BODY, email).message().as_bytes(linesep='\r\n')
+
+
+def build_once(emails):
+    prepared = PreparedMessage(SUBJECT, BODY)
+    for email in emails:
+        prepared.for_recipient(sanitize_address(email, prepared.encoding))
+
+
+def main():
+    emails = [f'client{i}@example.com' for i in range(RECIPIENTS)]
+    for name, func in (('каждый раз', build_each_time), ('один раз', build_once)):
+        start = time.perf_counter()
+        func(emails)
+        seconds = time.perf_counter() - start
+        print(f'{name:>10}: {seconds:.3f} с на {RECIPIENTS} писем '
+              f'({seconds / RECIPIENTS * 1e6:.1f} мкс на письмо)')
+
+
+if __name__ == '__main__':
+    main()
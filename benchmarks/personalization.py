@@ -0,0 +1,82 @@
+"""Стоимость персонализации письма на 100 000 получателей.
+
+Запуск из корня проекта::
+
+    python -m benchmarks.personalization
+
+Сравнивает скомпилированный шаблон с разбором текста регулярным выражением
+для каждого получателя, как это выглядело бы без предкомпиляции. Обе
+версии делают одни и те же подстановки; замер повторяется несколько раз и
+берётся лучшее время, отдельно для письма с подстановками и без них.
+"""
+import time
+from types import SimpleNamespace
+
+from mailing_app.personalization import CLIENT_FIELDS, PLACEHOLDER_RE, compile_template
+
+RECIPIENTS = 100_000
+REPEAT = 5
+SUBJECT = '{{ full_name }}, для вас новое предложение'
+BODY = (
+    'Здравствуйте, {{ full_name }}!\n\n'
+    'Письмо отправлено на {{ email }}. ' + 'Текст рассылки. ' * 40 + '\n\n'
+    'С уважением, сервис рассылок'
+)
+STATIC_SUBJECT = 'Новое предложение'
+STATIC_BODY = 'Здравствуйте!\n\n' + 'Текст рассылки. ' * 40 + '\n\nС уважением, сервис рассылок'
+
+
+def make_clients():
+    return [
+        SimpleNamespace(full_name=f'Клиент {i}', email=f'client{i}@example.com', comment='')
+        for i in range(RECIPIENTS)
+    ]
+
+
+def substitute(text, client):
+    """Подстановка регулярным выражением с теми же правилами, что у шаблона."""
+    def replace(match):
+        field = match.group(1)
+        if field not in CLIENT_FIELDS:
+            return match.group(0)
+        return str(getattr(client, field))
+
+    return PLACEHOLDER_RE.sub(replace, text)
+
+
+def render_compiled(clients, texts):
+    templates = [compile_template(text) for text in texts]
+    for client in clients:
+        for template in templates:
+            template.render(client)
+
+
+def render_regex(clients, texts):
+    for client in clients:
+        for text in texts:
+            substitute(text, client)
+
+
+def measure(func, clients, texts):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(clients, texts)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    clients = make_clients()
+    for case, texts in (('с подстановками', (SUBJECT, BODY)),
+                        ('без подстановок', (STATIC_SUBJECT, STATIC_BODY))):
+        print(f'Письмо {case}:')
+        for name, func in (('compiled', render_compiled), ('regex', render_regex)):
+            seconds = measure(func, clients, texts)
+            print(f'{name:>9}: {seconds:.3f} с на {RECIPIENTS} получателей '
+                  f'({seconds / RECIPIENTS * 1e6:.2f} мкс на письмо)')
+
+
+if __name__ == '__main__':
+    main()
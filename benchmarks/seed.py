@@ -0,0 +1,30 @@
+"""Наполнение базы данными для нагрузочных тестов."""
+import uuid
+
+from django.utils import timezone
+
+from mailing_app.models import Client, Mailing, Message
+from mailing_app.recipients import set_mailing_clients
+from users.models import CustomUser
+
+
+def seed_mailing(recipients, chunk_size=5000, personalized=False):
+    """Создаёт отдельного владельца, сообщение и рассылку на ``recipients`` клиентов.
+
+    Всё создаётся пачками; удаление владельца удаляет и сгенерированные данные.
+    """
+    tag = uuid.uuid4().hex[:12]
+    owner = CustomUser.objects.create(email=f'bench-{tag}@example.com', username=f'bench-{tag}')
+    subject = 'Нагрузочный тест' + (', {{ full_name }}' if personalized else '')
+    message = Message.objects.create(subject=subject, body='Текст рассылки. ' * 40, owner=owner)
+    for start in range(0, recipients, chunk_size):
+        Client.objects.bulk_create(
+            Client(email=f'{tag}-{i}@example.com', full_name=f'Клиент {i}', owner=owner)
+            for i in range(start, min(start + chunk_size, recipients))
+        )
+    now = timezone.now()
+    mailing = Mailing.objects.create(
+        owner=owner, message=message, start_time=now, end_time=now + timezone.timedelta(days=1)
+    )
+    set_mailing_clients(mailing, Client.objects.filter(owner=owner))
+    return mailing
@@ -0,0 +1,128 @@
+"""Пропускная способность отправки рассылки через локальный SMTP-сервер.
+
+Запуск из корня проекта::
+
+    python -m benchmarks.send --sizes 1000 10000 100000 --workers 4 --latency 0.002
+    python -m benchmarks.send --sizes 1000 10000 100000 --connections 10 --latency 0.002
+
+Для каждого размера создаёт в базе из настроек отдельного владельца с
+клиентами и рассылкой, отправляет её через ``send_mailing`` на
+``benchmarks.smtp_sink`` и удаляет созданные данные. Печатает писем в
+секунду, SQL-запросов на письмо и пиковый RSS процесса.
+"""
+import argparse
+import os
+import resource
+import threading
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mailing_project.settings')
+django.setup()
+
+from django.db import connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from benchmarks.seed import seed_mailing  # noqa: E402
+from benchmarks.smtp_sink import SMTPSink  # noqa: E402
+from mailing_app.models import Client, Suppression  # noqa: E402
+from mailing_app.services import send_mailing  # noqa: E402
+
+
+class QueryCounter:
+    """Считает SQL-запросы во всех соединениях, включая соединения потоков отправки.
+
+    ``CaptureQueriesContext`` видит только соединение текущего потока и
+    хранит текст каждого запроса, поэтому здесь нужен только счётчик.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        for connection in connections.all():
+            self.install(connection)
+        connection_created.connect(self.on_connection_created)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        connection_created.disconnect(self.on_connection_created)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        self.install(connection)
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux измеряется в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(size, sink, workers, connections, personalized):
+    mailing = seed_mailing(size, personalized=personalized)
+    email_settings = {
+        'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+        'EMAIL_HOST': sink.host,
+        'EMAIL_PORT': sink.port,
+        'EMAIL_USE_SSL': False,
+        'EMAIL_USE_TLS': False,
+        'EMAIL_HOST_USER': '',
+        'EMAIL_HOST_PASSWORD': '',
+    }
+    received, rejected, deferred = sink.received, sink.rejected, sink.deferred
+    try:
+        with override_settings(**email_settings), QueryCounter() as queries:
+            start = time.perf_counter()
+            send_mailing(mailing, workers=workers, resume=False, connections=connections)
+            seconds = time.perf_counter() - start
+    finally:
+        # Адреса, которым сервер отказал, попадают в список подавления
+        Suppression.objects.filter(
+            email__in=Client.objects.filter(owner=mailing.owner).values('email')
+        ).delete()
+        mailing.owner.delete()
+    delivered = sink.received - received
+    print(f'{size:>7} получателей: {seconds:7.2f} с, {size / seconds:8.0f} писем/с, '
+          f'{queries.count / size:.3f} запросов на письмо, '
+          f'доставлено {delivered}, отказов {sink.rejected - rejected}, '
+          f'отложено {sink.deferred - deferred}, '
+          f'пиковый RSS {peak_rss_mb():.0f} МБ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10_000, 100_000])
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--connections', type=int, default=None,
+                        help='Отправлять через asyncio-бэкенд с пулом из стольких соединений')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Задержка ответа SMTP-сервера на письмо, с')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Доля получателей, которым сервер отказывает')
+    parser.add_argument('--deferral-rate', type=float, default=0.0,
+                        help='Доля получателей, которым сервер отвечает временной ошибкой')
+    parser.add_argument('--personalized', action='store_true',
+                        help='Подставлять имя клиента в тему письма')
+    options = parser.parse_args()
+    with SMTPSink(latency=options.latency, failure_rate=options.failure_rate,
+                  deferral_rate=options.deferral_rate, seed=0) as sink:
+        for size in options.sizes:
+            run(size, sink, options.workers, options.connections, options.personalized)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Локальный SMTP-сервер для нагрузочных тестов отправки.
+
+Принимает письма и выбрасывает их, имитируя задержку ответа на каждое
+письмо, долю постоянных отказов ``550`` и временных ``451`` на этапе RCPT. Каждое соединение
+обслуживается в своём потоке, как у настоящего релея.
+"""
+import random
+import socketserver
+import threading
+import time
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        self.reply('220 sink ESMTP')
+        recipients = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].decode('ascii', 'replace').upper()
+            sink.log(verb)
+            if verb == 'EHLO':
+                pipelining = b'250-PIPELINING\r\n' if sink.pipelining else b''
+                self.wfile.write(b'250-sink\r\n' + pipelining + b'250-8BITMIME\r\n250 SMTPUTF8\r\n')
+            elif verb == 'MAIL' and sink.take_disconnect():
+                return
+            elif verb == 'RCPT':
+                address = line[8:].strip().strip(b'<>').decode('ascii', 'replace')
+                failure = sink.pick_failure(address)
+                if failure not in (None, 'reject', 'defer'):
+                    self.reply(failure)
+                elif failure == 'reject':
+                    self.reply('550 5.1.1 Mailbox unavailable')
+                elif failure == 'defer':
+                    self.reply('451 4.7.1 Try again later')
+                else:
+                    recipients += 1
+                    self.reply('250 OK')
+            elif verb == 'DATA':
+                if not recipients and sink.lenient_data:
+                    # Как некоторые серверы с PIPELINING: данные принимаются
+                    # и отклоняются уже после точки
+                    self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    self.read_data()
+                    self.reply('554 No valid recipients')
+                    continue
+                if not recipients:
+                    self.reply('554 No valid recipients')
+                    continue
+                recipients = 0
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                self.read_data()
+                if sink.latency:
+                    time.sleep(sink.latency)
+                sink.accept()
+                self.reply('250 OK queued')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            elif verb in ('MAIL', 'RSET'):
+                recipients = 0
+                self.reply('250 OK')
+            elif verb in ('HELO', 'NOOP'):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Command not implemented')
+
+    def read_data(self):
+        for line in self.rfile:
+            if line == b'.\r\n':
+                return
+
+
+class SMTPSink:
+    """SMTP-приёмник в фоновом потоке.
+
+    ``latency`` — задержка ответа на каждое письмо в секундах,
+    ``failure_rate`` — доля получателей, которым отвечают постоянным отказом,
+    ``deferral_rate`` — доля получателей с временной ошибкой.
+
+    ``rcpt_replies`` задаёт ответ на RCPT для отдельных адресов, например
+    ``{'bad@example.com': '550 5.1.1 No such user'}``. Без ``pipelining``
+    сервер не объявляет PIPELINING, с ``lenient_data`` отвечает ``354`` на
+    DATA и без принятых получателей. ``disconnect(n)`` обрывает соединение
+    на следующих ``n`` командах MAIL. С ``record`` все полученные команды
+    складываются в ``commands`` — это нужно тестам, а в замерах памяти
+    журнал только мешал бы, поэтому по умолчанию он не ведётся.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0,
+                 deferral_rate=0.0, seed=None, rcpt_replies=None, pipelining=True,
+                 lenient_data=False, record=False):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.deferral_rate = deferral_rate
+        self.rcpt_replies = rcpt_replies or {}
+        self.pipelining = pipelining
+        self.lenient_data = lenient_data
+        self.received = 0
+        self.rejected = 0
+        self.deferred = 0
+        self.record = record
+        self.commands = []
+        self._disconnects = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def pick_failure(self, address=None):
+        with self._lock:
+            if address in self.rcpt_replies:
+                return self.rcpt_replies[address]
+            roll = self._random.random()
+            if roll < self.failure_rate:
+                self.rejected += 1
+                return 'reject'
+            if roll < self.failure_rate + self.deferral_rate:
+                self.deferred += 1
+                return 'defer'
+            return None
+
+    def log(self, verb):
+        if not self.record:
+            return
+        with self._lock:
+            self.commands.append(verb)
+
+    def disconnect(self, count=1):
+        with self._lock:
+            self._disconnects += count
+
+    def take_disconnect(self):
+        with self._lock:
+            if not self._disconnects:
+                return False
+            self._disconnects -= 1
+            return True
+
+    def accept(self):
+        with self._lock:
+            self.received += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -1,7 +1,14 @@
 from django.contrib import admin
-from .models import Client, Message, Mailing, Attempt
+from .models import Client, Message, Mailing, Attempt, SendJob, DailyStat, Segment, Suppression, RetryEntry, MailingShard, DeliveryRecord
 
 admin.site.register(Client)
 admin.site.register(Message)
 admin.site.register(Mailing)
-admin.site.register(Attempt)
\ No newline at end of file
+admin.site.register(Attempt)
+admin.site.register(SendJob)
+admin.site.register(DailyStat)
+admin.site.register(Segment)
+admin.site.register(Suppression)
+admin.site.register(RetryEntry)
+admin.site.register(MailingShard)
+admin.site.register(DeliveryRecord)
@@ -0,0 +1,57 @@
+import gzip
+import json
+from datetime import datetime, time, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Attempt, DeliveryRecord
+
+FIELDS = ('id', 'mailing_id', 'client_id', 'timestamp', 'status', 'server_response')
+
+
+def archive_attempts(older_than_days, directory=None, chunk_size=None):
+    """Переносит попытки старше ``older_than_days`` дней в сжатый JSONL.
+
+    Архивируются только целые дни. Дневная статистика ведётся при записи
+    попыток и здесь не пересчитывается, так что итоги отчётов не меняются, а
+    итог по каждому клиенту остаётся в ``DeliveryRecord``, чтобы продолжение
+    отправки не написало ему повторно.
+    Строки читаются и удаляются пачками по id. Возвращает путь к файлу и число
+    перенесённых строк.
+    """
+    chunk_size = chunk_size or settings.MAILING_ARCHIVE_CHUNK_SIZE
+    directory = Path(directory or settings.MAILING_ARCHIVE_DIR)
+    before = timezone.localdate() - timedelta(days=older_than_days)
+    cutoff = timezone.make_aware(datetime.combine(before, time.min))
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'attempts-before-{before}-{timezone.now():%Y%m%d%H%M%S}.jsonl.gz'
+    old_attempts = Attempt.objects.filter(timestamp__lt=cutoff).order_by('id')
+    archived = 0
+    last_id = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as archive:
+        while True:
+            rows = list(old_attempts.filter(id__gt=last_id).values_list(*FIELDS)[:chunk_size])
+            if not rows:
+                break
+            for row in rows:
+                archive.write(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False, default=str) + '\n')
+            archive.flush()
+            last_id = rows[-1][0]
+            with transaction.atomic():
+                DeliveryRecord.objects.bulk_create(
+                    [
+                        DeliveryRecord(mailing_id=row[1], client_id=row[2], status=row[4])
+                        for row in rows if row[2] is not None
+                    ],
+                    ignore_conflicts=True,
+                )
+                Attempt.objects.filter(id__in=[row[0] for row in rows]).delete()
+            archived += len(rows)
+    if not archived:
+        path.unlink()
+        path = None
+    return path, archived
@@ -0,0 +1,292 @@
+import asyncio
+import base64
+import re
+import ssl
+from functools import cached_property
+from smtplib import (
+    SMTPAuthenticationError,
+    SMTPConnectError,
+    SMTPDataError,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
+    SMTPSenderRefused,
+    SMTPServerDisconnected,
+)
+
+from django.conf import settings
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+
+LINE_END_RE = re.compile(rb'\r\n|\n|\r(?!\n)')
+LEADING_DOT_RE = re.compile(rb'(?m)^\.')
+
+
+class SMTPConnection:
+    """Одно SMTP-соединение поверх asyncio-потоков.
+
+    Если сервер объявляет ``PIPELINING``, команды MAIL, RCPT и DATA уходят
+    одной записью, и письмо стоит два обмена с сервером вместо трёх и
+    больше. Ошибки сервера поднимаются теми же исключениями ``smtplib``,
+    что и у синхронного бэкенда.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.reader = None
+        self.writer = None
+        self.features = {}
+        self.is_open = False
+        self.sent_in_batch = 0
+
+    async def open(self):
+        backend = self.backend
+        self.reader, self.writer = await self._io(asyncio.open_connection(
+            backend.host, backend.port, ssl=backend.ssl_context if backend.use_ssl else None,
+        ))
+        self.is_open = True
+        self.sent_in_batch = 0
+        try:
+            code, message = await self.read_reply()
+            if code != 220:
+                raise SMTPConnectError(code, message)
+            await self.ehlo()
+            if backend.use_tls:
+                await self.expect('STARTTLS', 220)
+                await self._io(self.writer.start_tls(backend.ssl_context, server_hostname=backend.host))
+                await self.ehlo()
+            if backend.username and backend.password:
+                await self.login(backend.username, backend.password)
+        except Exception:
+            self.abort()
+            raise
+
+    async def close(self):
+        if not self.is_open:
+            return
+        try:
+            await self.command('QUIT')
+        except (SMTPServerDisconnected, OSError):
+            pass
+        self.abort()
+
+    def abort(self):
+        self.is_open = False
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def reconnect(self):
+        await self.close()
+        await self.open()
+
+    async def _io(self, awaitable):
+        try:
+            return await asyncio.wait_for(awaitable, self.backend.timeout)
+        except (OSError, TimeoutError):
+            self.abort()
+            raise
+
+    async def read_reply(self):
+        lines = []
+        while True:
+            line = await self._io(self.reader.readline())
+            if not line:
+                self.abort()
+                raise SMTPServerDisconnected('Соединение закрыто сервером')
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                return int(line[:3]), b'\n'.join(lines)
+
+    async def write(self, data):
+        if not self.is_open:
+            raise SMTPServerDisconnected('Соединение не открыто')
+        self.writer.write(data)
+        await self._io(self.writer.drain())
+
+    async def command(self, line):
+        await self.write(line.encode('ascii') + b'\r\n')
+        return await self.read_reply()
+
+    async def expect(self, line, expected_code):
+        code, message = await self.command(line)
+        if code != expected_code:
+            raise SMTPResponseException(code, message)
+        return message
+
+    async def ehlo(self):
+        code, message = await self.command(f'EHLO {DNS_NAME}')
+        self.features = {}
+        if code != 250:
+            await self.expect(f'HELO {DNS_NAME}', 250)
+            return
+        for line in message.decode('latin-1').splitlines()[1:]:
+            keyword, _, params = line.partition(' ')
+            self.features[keyword.lower()] = params
+
+    async def login(self, username, password):
+        mechanisms = self.features.get('auth', '').upper().split()
+        if 'PLAIN' in mechanisms or 'LOGIN' not in mechanisms:
+            token = base64.b64encode(f'\0{username}\0{password}'.encode()).decode('ascii')
+            code, message = await self.command(f'AUTH PLAIN {token}')
+        else:
+            await self.expect('AUTH LOGIN', 334)
+            await self.expect(base64.b64encode(username.encode()).decode('ascii'), 334)
+            code, message = await self.command(base64.b64encode(password.encode()).decode('ascii'))
+        if code != 235:
+            raise SMTPAuthenticationError(code, message)
+
+    async def deliver(self, from_addr, recipients, data):
+        """Отправляет письмо, открывая и переоткрывая соединение как ``MailSender``."""
+        if not self.is_open:
+            await self.open()
+        elif self.sent_in_batch >= self.backend.batch_size:
+            await self.reconnect()
+        try:
+            refused = await self.sendmail(from_addr, recipients, data)
+        except (SMTPServerDisconnected, ConnectionError, TimeoutError):
+            await self.reconnect()
+            refused = await self.sendmail(from_addr, recipients, data)
+        self.sent_in_batch += 1
+        return refused
+
+    async def sendmail(self, from_addr, recipients, data):
+        commands = [f'MAIL FROM:<{from_addr}>'] + [f'RCPT TO:<{r}>' for r in recipients]
+        if 'pipelining' in self.features:
+            await self.write(''.join(f'{line}\r\n' for line in commands + ['DATA']).encode('ascii'))
+            replies = [await self.read_reply() for _ in range(len(commands) + 1)]
+        else:
+            replies = []
+            for line in commands:
+                replies.append(await self.command(line))
+                if replies[0][0] != 250:
+                    break
+            if replies[0][0] == 250 and any(code in (250, 251) for code, _ in replies[1:]):
+                replies.append(await self.command('DATA'))
+
+        mail_code, mail_message = replies[0]
+        refused = {
+            recipient: reply for recipient, reply in zip(recipients, replies[1:len(commands)])
+            if reply[0] not in (250, 251)
+        }
+        data_code, data_message = replies[len(commands)] if len(replies) > len(commands) else (None, b'')
+        if data_code == 354 and (mail_code != 250 or len(refused) == len(recipients)):
+            # Сервер принял DATA без единого получателя — завершаем пустое письмо
+            await self.write(b'.\r\n')
+            await self.read_reply()
+        if mail_code != 250:
+            await self.command('RSET')
+            raise SMTPSenderRefused(mail_code, mail_message, from_addr)
+        if len(refused) == len(recipients):
+            await self.command('RSET')
+            raise SMTPRecipientsRefused(refused)
+        if data_code != 354:
+            await self.command('RSET')
+            raise SMTPDataError(data_code, data_message)
+
+        data = LEADING_DOT_RE.sub(b'..', LINE_END_RE.sub(b'\r\n', data))
+        if not data.endswith(b'\r\n'):
+            data += b'\r\n'
+        await self.write(data + b'.\r\n')
+        code, message = await self.read_reply()
+        if code != 250:
+            raise SMTPDataError(code, message)
+        return refused
+
+
+class SMTPPool:
+    """Пул SMTP-соединений: каждое соединение ведёт одно письмо за раз.
+
+    Соединения создаются по мере надобности, но не больше ``size``;
+    освободившееся соединение сразу берёт следующее письмо.
+    """
+
+    def __init__(self, backend, size):
+        self.backend = backend
+        self.size = size
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def sendmail(self, from_addr, recipients, data):
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else SMTPConnection(self.backend)
+            try:
+                return await connection.deliver(from_addr, recipients, data)
+            finally:
+                self.idle.append(connection)
+
+    async def send_message(self, message):
+        if not message.recipients():
+            return False
+        encoding = message.encoding or settings.DEFAULT_CHARSET
+        from_addr = sanitize_address(message.from_email, encoding)
+        recipients = [sanitize_address(address, encoding) for address in message.recipients()]
+        await self.sendmail(from_addr, recipients, message.message().as_bytes(linesep='\r\n'))
+        return True
+
+    async def close(self):
+        connections, self.idle = self.idle, []
+        await asyncio.gather(*(connection.close() for connection in connections))
+
+
+class EmailBackend(BaseEmailBackend):
+    """Асинхронный SMTP-бэкенд с пулом соединений.
+
+    Берёт настройки из тех же ``EMAIL_*``, что и стандартный SMTP-бэкенд.
+    ``send_messages`` можно вызывать из синхронного кода — письма всё равно
+    уходят параллельно через пул из ``pool_size`` соединений.
+    """
+
+    def __init__(self, host=None, port=None, username=None, password=None, use_tls=None,
+                 use_ssl=None, timeout=None, ssl_keyfile=None, ssl_certfile=None,
+                 pool_size=None, batch_size=None, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        self.host = host or settings.EMAIL_HOST
+        self.port = port or settings.EMAIL_PORT
+        self.username = settings.EMAIL_HOST_USER if username is None else username
+        self.password = settings.EMAIL_HOST_PASSWORD if password is None else password
+        self.use_tls = settings.EMAIL_USE_TLS if use_tls is None else use_tls
+        self.use_ssl = settings.EMAIL_USE_SSL if use_ssl is None else use_ssl
+        self.timeout = settings.EMAIL_TIMEOUT if timeout is None else timeout
+        self.ssl_keyfile = settings.EMAIL_SSL_KEYFILE if ssl_keyfile is None else ssl_keyfile
+        self.ssl_certfile = settings.EMAIL_SSL_CERTFILE if ssl_certfile is None else ssl_certfile
+        self.pool_size = pool_size or settings.MAILING_ASYNC_POOL_SIZE
+        self.batch_size = batch_size or settings.MAILING_SMTP_BATCH_SIZE
+        if self.use_ssl and self.use_tls:
+            raise ValueError('EMAIL_USE_TLS и EMAIL_USE_SSL нельзя включать одновременно.')
+
+    @cached_property
+    def ssl_context(self):
+        context = ssl.create_default_context()
+        if self.ssl_certfile:
+            context.load_cert_chain(self.ssl_certfile, self.ssl_keyfile)
+        return context
+
+    def pool(self, size=None):
+        return SMTPPool(self, size or self.pool_size)
+
+    def send_messages(self, email_messages):
+        if not email_messages:
+            return 0
+        return asyncio.run(self.asend_messages(email_messages))
+
+    async def asend_messages(self, email_messages):
+        async with self.pool() as pool:
+            results = await asyncio.gather(
+                *(pool.send_message(message) for message in email_messages),
+                return_exceptions=True,
+            )
+        sent = 0
+        for result in results:
+            if isinstance(result, Exception):
+                if not self.fail_silently:
+                    raise result
+            elif result:
+                sent += 1
+        return sent
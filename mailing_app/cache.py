@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+
+EPOCH_KEY = 'mailing:version:epoch'
+GLOBAL_KEY = 'mailing:version:all'
+
+
+def _owner_key(owner_id):
+    return f'mailing:version:owner:{owner_id}'
+
+
+def _initial_version():
+    # Версия из времени, а не с нуля: после вытеснения ключа из кеша номер
+    # не повторится и старые фрагменты не оживут.
+    return time.time_ns()
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), timeout=None)
+
+
+def cache_version(user):
+    """Версия данных, которые видит пользователь, для ключей кеша.
+
+    Менеджер видит данные всех владельцев, поэтому его версия меняется при
+    любом изменении, а версия обычного пользователя — только при изменении
+    его данных.
+    """
+    key = GLOBAL_KEY if user.role == 'manager' else _owner_key(user.pk)
+    keys = [EPOCH_KEY, key]
+    versions = cache.get_many(keys)
+    for k in keys:
+        if k not in versions:
+            initial = _initial_version()
+            cache.add(k, initial, timeout=None)
+            versions[k] = cache.get(k, initial)
+    return f'{versions[EPOCH_KEY]}.{versions[key]}'
+
+
+def bump_owner_versions(owner_ids):
+    """Сбрасывает кеши владельцев ``owner_ids`` и менеджеров."""
+    owner_ids = {owner_id for owner_id in owner_ids if owner_id is not None}
+    if not owner_ids:
+        return
+    for owner_id in owner_ids:
+        _bump(_owner_key(owner_id))
+    _bump(GLOBAL_KEY)
+
+
+def bump_all_versions():
+    """Сбрасывает кеши всех пользователей сразу."""
+    _bump(EPOCH_KEY)
@@ -0,0 +1,45 @@
+import csv
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo:
+    """Псевдофайл для ``csv.writer``: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(fields, rows):
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(fields, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=str) + '\n'
+
+
+def export_response(queryset, fields, filename, fmt='csv'):
+    """Отдаёт ``queryset`` потоком в CSV или JSONL.
+
+    Строки читаются из базы через ``iterator()`` проекцией ``values_list``,
+    так что память не зависит от объёма выгрузки, а первые байты уходят
+    клиенту сразу.
+    """
+    if fmt not in FORMATS:
+        fmt = 'csv'
+    rows = queryset.values_list(*fields).iterator(chunk_size=settings.MAILING_EXPORT_CHUNK_SIZE)
+    lines = csv_lines(fields, rows) if fmt == 'csv' else jsonl_lines(fields, rows)
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
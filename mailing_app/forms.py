@@ -1,24 +1,98 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Client, Message, Mailing
+from django.db.models import Q
+from .models import Client, Message, Mailing, Segment
+from .recipients import format_id_ranges, parse_id_ranges, set_mailing_clients
 
 class ClientForm(forms.ModelForm):
     class Meta:
         model = Client
         fields = ['email', 'full_name', 'comment']
 
+class ClientImportForm(forms.Form):
+    file = forms.FileField(label='CSV-файл')
+
+class SegmentForm(forms.ModelForm):
+    class Meta:
+        model = Segment
+        fields = ['name', 'email_domain', 'comment_contains', 'created_from', 'created_to']
+        widgets = {
+            'created_from': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+            'created_to': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
+        }
+
 class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
         fields = ['subject', 'body']
+        help_texts = {
+            'body': 'Можно подставлять данные клиента: {{ full_name }}, {{ email }}, {{ comment }}',
+        }
 
 class MailingForm(forms.ModelForm):
+    recipients = forms.CharField(
+        label='Клиенты', required=False,
+        help_text='ID клиентов и диапазоны через запятую, например: 1-500, 731, 900-950',
+    )
+    all_clients = forms.BooleanField(label='Все мои клиенты', required=False)
+
     class Meta:
         model = Mailing
-        fields = ['start_time', 'end_time', 'status', 'message', 'clients']
+        fields = ['start_time', 'end_time', 'status', 'message', 'segment']
         widgets = {
             'start_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
             'end_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}),
-            'clients': forms.SelectMultiple(),
         }
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        owner = self.instance.owner if self.instance.owner_id else user
+        if owner is not None:
+            self.fields['segment'].queryset = Segment.objects.filter(owner=owner)
+        if self.instance.pk:
+            self.initial.setdefault('recipients', format_id_ranges(
+                self.instance.clients.order_by('id').values_list('id', flat=True).iterator()
+            ))
+
+    def clean_recipients(self):
+        try:
+            return parse_id_ranges(self.cleaned_data['recipients'])
+        except ValueError:
+            raise forms.ValidationError('Укажите ID или диапазоны вида 1-500 через запятую.')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('all_clients') and not cleaned_data.get('recipients') \
+                and not cleaned_data.get('segment') and 'recipients' not in self.errors:
+            raise forms.ValidationError('Выберите клиентов или сегмент рассылки.')
+        return cleaned_data
+
+    def selected_clients(self):
+        owner = self.instance.owner if self.instance.owner_id else self.user
+        if self.cleaned_data['all_clients']:
+            return Client.objects.filter(owner=owner)
+        if not self.cleaned_data['recipients']:
+            return Client.objects.none()
+        clients = Client.objects.all()
+        if self.user is None or self.user.role != 'manager':
+            clients = clients.filter(owner=owner)
+        ranges = Q()
+        for first, last in self.cleaned_data['recipients']:
+            ranges |= Q(id__range=(first, last))
+        return clients.filter(ranges)
+
+    def save(self, commit=True):
+        mailing = super().save(commit)
+        if commit:
+            set_mailing_clients(mailing, self.selected_clients())
+        else:
+            save_m2m = self.save_m2m
+
+            def save_clients():
+                save_m2m()
+                set_mailing_clients(mailing, self.selected_clients())
+
+            self.save_m2m = save_clients
+        return mailing
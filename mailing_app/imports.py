@@ -0,0 +1,109 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db.models.functions import Lower
+
+from .models import Client
+
+FIELDS = ('email', 'full_name', 'comment')
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.started = time.monotonic()
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f'Строк: {self.rows}, добавлено: {self.created}, дубликатов: {self.duplicates}, '
+            f'с ошибками: {self.invalid}, {self.seconds:.1f} с ({self.rate:.0f} строк/с)'
+        )
+
+
+def normalize_email(value):
+    email = (value or '').strip().lower()
+    validate_email(email)
+    return email
+
+
+def _rows(lines):
+    """Читает CSV построчно и отдаёт словари email/full_name/comment.
+
+    Если первая строка содержит колонку ``email``, она считается заголовком,
+    иначе колонки идут в порядке email, full_name, comment.
+    """
+    reader = csv.reader(lines)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [column.strip().lower() for column in first]
+    if 'email' in header:
+        positions = {field: header.index(field) for field in FIELDS if field in header}
+    else:
+        positions = {field: i for i, field in enumerate(FIELDS)}
+        yield _pick(first, positions)
+    for row in reader:
+        yield _pick(row, positions)
+
+
+def _pick(row, positions):
+    return {field: row[i] if i < len(row) else '' for field, i in positions.items()}
+
+
+def import_clients(lines, owner, chunk_size=None):
+    """Импортирует клиентов из CSV-потока ``lines`` пачками.
+
+    В памяти держится только текущая пачка, поэтому расход памяти не зависит
+    от размера файла. Адреса, уже существующие в базе (без учёта регистра)
+    или повторяющиеся в файле, пропускаются.
+    """
+    chunk_size = chunk_size or settings.MAILING_IMPORT_CHUNK_SIZE
+    result = ImportResult()
+    chunk = {}
+    for row in _rows(lines):
+        result.rows += 1
+        try:
+            email = normalize_email(row.get('email'))
+        except ValidationError:
+            result.invalid += 1
+            continue
+        if email in chunk:
+            result.duplicates += 1
+            continue
+        chunk[email] = Client(
+            email=email,
+            full_name=(row.get('full_name') or '').strip()[:255] or email.split('@')[0],
+            comment=(row.get('comment') or '').strip(),
+            owner=owner,
+        )
+        if len(chunk) >= chunk_size:
+            _save_chunk(chunk, result)
+            chunk = {}
+    _save_chunk(chunk, result)
+    result.seconds = time.monotonic() - result.started
+    return result
+
+
+def _save_chunk(chunk, result):
+    if not chunk:
+        return
+    existing = set(
+        Client.objects.annotate(email_lower=Lower('email'))
+        .filter(email_lower__in=chunk.keys())
+        .values_list('email_lower', flat=True)
+    )
+    new_clients = [client for email, client in chunk.items() if email not in existing]
+    Client.objects.bulk_create(new_clients, ignore_conflicts=True)
+    result.created += len(new_clients)
+    result.duplicates += len(existing)
@@ -0,0 +1,143 @@
+import threading
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .leases import WORKER_ID, Lease
+from .models import RetryEntry, SendJob
+from .services import AttemptWriter, Dispatch
+from .shards import claim_shard, create_shards, lock_mailing, not_scheduled, run_shard
+from .suppression import SuppressionIndex
+
+
+def enqueue_mailing(mailing):
+    """Ставит рассылку в очередь, если она там ещё не стоит.
+
+    Вторую незавершённую задачу не даёт создать ограничение
+    ``sendjob_active_mailing_uniq``, так что двойной клик ставит одну задачу.
+    """
+    active = SendJob.objects.filter(mailing=mailing, status__in=SendJob.ACTIVE_STATUSES)
+    job = active.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return SendJob.objects.create(mailing=mailing)
+    except IntegrityError:
+        return active.first()
+
+
+JOB_LEASE = Lease(SendJob, 'В очереди', 'Выполняется', 'MAILING_JOB_LEASE')
+
+
+def claim_next_job(worker_id=WORKER_ID):
+    """Забирает старейшую задачу из очереди или задачу с истёкшей арендой.
+
+    Строки, заблокированные другими обработчиками, пропускаются, поэтому
+    несколько ``run_mail_worker`` могут работать одновременно. Задачу
+    упавшего обработчика подбирает следующий, когда истечёт её аренда.
+    Задачи рассылок, которые сейчас отправляет планировщик, ждут в очереди.
+    """
+    jobs = not_scheduled(SendJob.objects.order_by('created_at'))
+    with transaction.atomic():
+        job = JOB_LEASE.claim(jobs, worker_id, started_at=timezone.now())
+        if job is None or lock_mailing(job.mailing_id):
+            return job
+        transaction.set_rollback(True)
+    return None
+
+
+def renew_job_lease(job):
+    """Продлевает аренду задачи; ``False``, если её уже забрал другой обработчик."""
+    return JOB_LEASE.renew(job)
+
+
+def run_job(job, on_result=None):
+    """Делит рассылку на шарды и отправляет их, пока есть свободные.
+
+    Свободные шарды этой рассылки параллельно забирают и другие обработчики,
+    так что задача завершается, когда все шарды разобраны, — последние из
+    них могут ещё отправляться на других узлах. Если обработчик прервали,
+    задача возвращается в очередь.
+    """
+    stop_event = threading.Event()
+    keeper = JOB_LEASE.keeper(job, stop_event)
+    status, error = 'В очереди', ''
+    try:
+        with keeper:
+            create_shards(job.mailing)
+            while not stop_event.is_set() and (shard := claim_shard(job.mailing)) is not None:
+                run_shard(shard, on_result=on_result, stop_event=stop_event)
+        if not stop_event.is_set():
+            status = 'Выполнено'
+    except Exception as e:
+        status, error = 'Ошибка', str(e)
+    finally:
+        if not keeper.lost:
+            finished_at = None if status == 'В очереди' else timezone.now()
+            JOB_LEASE.release(job, status, error=error, finished_at=finished_at)
+    return job
+
+
+def claim_due_retries(limit=None, mailing=None):
+    """Забирает записи очереди повторов, время которых подошло.
+
+    Забранные записи откладываются на ``MAILING_RETRY_MAX_DELAY``: если
+    обработчик упадёт, не дойдя до них, их подберёт следующий. С ``mailing``
+    забираются только записи этой рассылки.
+    """
+    now = timezone.now()
+    # Блокируются только сами записи, а не рассылки и клиенты из select_related
+    entries = RetryEntry.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+        next_attempt_at__lte=now
+    )
+    if mailing is not None:
+        entries = entries.filter(mailing=mailing)
+    with transaction.atomic():
+        entries = list(
+            entries.select_related('mailing__message', 'client')
+            .order_by('next_attempt_at')[:limit or settings.MAILING_RETRY_BATCH_SIZE]
+        )
+        RetryEntry.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+            next_attempt_at=now + timedelta(seconds=settings.MAILING_RETRY_MAX_DELAY)
+        )
+    return entries
+
+
+def run_retries(on_result=None, limit=None, mailing=None):
+    """Повторяет отправку по подошедшим записям очереди повторов.
+
+    Возвращает количество обработанных записей.
+    """
+    entries = claim_due_retries(limit, mailing)
+    if not entries:
+        return 0
+    suppressed = SuppressionIndex.load()
+    entries.sort(key=lambda entry: entry.mailing_id)
+    for _, group in groupby(entries, key=lambda entry: entry.mailing_id):
+        group = list(group)
+        with AttemptWriter() as writer:
+            dispatch = Dispatch(group[0].mailing, writer, on_result, suppressed=suppressed)
+            finished, rescheduled = dispatch.retry(group)
+        RetryEntry.objects.filter(pk__in=[entry.pk for entry in finished]).delete()
+        RetryEntry.objects.bulk_update(rescheduled, ['retry_count', 'next_attempt_at', 'last_error'])
+    return len(entries)
+
+
+def drain_retries(mailing, on_result=None, stop_event=None):
+    """Повторяет отправку рассылки, пока её очередь повторов не опустеет.
+
+    Между повторами ждёт, когда подойдёт время ближайшей записи. Очередь
+    разбирают и другие обработчики, поэтому ожидание не дольше минуты.
+    """
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        run_retries(on_result, mailing=mailing)
+        next_entry = mailing.retries.order_by('next_attempt_at').first()
+        if next_entry is None:
+            return
+        wait = (next_entry.next_attempt_at - timezone.now()).total_seconds()
+        stop_event.wait(min(max(wait, 0), 60))
@@ -0,0 +1,138 @@
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection as db_connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'
+
+
+class Lease:
+    """Аренда строк модели обработчиками: статус, владелец и срок аренды.
+
+    Строку в статусе ``waiting`` или в статусе ``running`` с истёкшей (или
+    не записанной) арендой может забрать любой обработчик; продлевает и
+    отпускает её только тот, кто записан владельцем. Продолжительность
+    аренды берётся из настройки ``duration_setting``.
+    """
+
+    def __init__(self, model, waiting, running, duration_setting,
+                 owner_field='lease_owner', expires_field='lease_expires_at'):
+        self.model = model
+        self.waiting = waiting
+        self.running = running
+        self.duration_setting = duration_setting
+        self.owner_field = owner_field
+        self.expires_field = expires_field
+
+    @property
+    def seconds(self):
+        return getattr(settings, self.duration_setting)
+
+    def expires_at(self):
+        return timezone.now() + timedelta(seconds=self.seconds)
+
+    def claimable(self, now=None):
+        """Условие на строки, которые можно взять в аренду."""
+        now = now or timezone.now()
+        expired = Q(**{f'{self.expires_field}__lt': now}) | Q(**{f'{self.expires_field}__isnull': True})
+        return Q(status=self.waiting) | (Q(status=self.running) & expired)
+
+    def claim(self, queryset, worker_id=WORKER_ID, **fields):
+        """Берёт в аренду первую подходящую строку ``queryset``.
+
+        Строки, заблокированные другими обработчиками, пропускаются. В
+        ``fields`` — что ещё записать в строку при захвате.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            obj = (
+                queryset.select_for_update(skip_locked=True, of=('self',))
+                .filter(self.claimable(now))
+                .first()
+            )
+            if obj is None:
+                return None
+            values = {
+                'status': self.running,
+                self.owner_field: worker_id,
+                self.expires_field: now + timedelta(seconds=self.seconds),
+                **fields,
+            }
+            for name, value in values.items():
+                setattr(obj, name, value)
+            obj.save(update_fields=list(values))
+        return obj
+
+    def held(self, obj):
+        return self.model.objects.filter(
+            pk=obj.pk, status=self.running, **{self.owner_field: getattr(obj, self.owner_field)}
+        )
+
+    def renew(self, obj):
+        """Продлевает аренду; ``False``, если строку уже забрал другой обработчик."""
+        return bool(self.held(obj).update(**{self.expires_field: self.expires_at()}))
+
+    def release(self, obj, status, **fields):
+        """Отпускает строку, переводя её в ``status``; ``False``, если аренду перехватили."""
+        values = {'status': status, self.owner_field: '', self.expires_field: None, **fields}
+        released = bool(self.held(obj).update(**values))
+        if released:
+            for name, value in values.items():
+                setattr(obj, name, value)
+        return released
+
+    def keeper(self, obj, stop_event):
+        return LeaseKeeper(lambda: self.renew(obj), stop_event, self.seconds)
+
+
+class LeaseKeeper:
+    """Продлевает аренду в фоновом потоке, пока идёт отправка.
+
+    ``renew`` продлевает аренду и возвращает ``False``, если её перехватил
+    другой обработчик; тогда выставляется ``stop_event``, и отправка
+    останавливается после текущего письма. Ошибку при продлении (например,
+    обрыв связи с базой) поток переживает и пробует снова, но если аренда
+    успеет истечь, считает её потерянной.
+    """
+
+    def __init__(self, renew, stop_event, lease):
+        self.renew = renew
+        self.stop_event = stop_event
+        self.lease = lease
+        self.interval = self.lease / 3
+        self.lost = False
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.done.set()
+        self.thread.join()
+
+    def run(self):
+        deadline = time.monotonic() + self.lease
+        try:
+            while not self.done.wait(self.interval):
+                try:
+                    renewed = self.renew()
+                except Exception:
+                    db_connection.close()
+                    if time.monotonic() + self.interval < deadline:
+                        continue
+                    renewed = False
+                if not renewed:
+                    self.lost = True
+                    self.stop_event.set()
+                    return
+                deadline = time.monotonic() + self.lease
+        finally:
+            db_connection.close()
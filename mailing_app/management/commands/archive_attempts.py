@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from mailing_app.archive import archive_attempts
+
+class Command(BaseCommand):
+    help = 'Переносит старые попытки рассылок в сжатые JSONL-файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True,
+                            help='Архивировать попытки старше указанного числа дней')
+        parser.add_argument('--output-dir', help='Каталог для архивов')
+        parser.add_argument('--chunk-size', type=int, help='Сколько строк переносить за раз')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError('--older-than должно быть не меньше 1.')
+        path, archived = archive_attempts(
+            options['older_than'], options['output_dir'], options['chunk_size']
+        )
+        if path is None:
+            self.stdout.write('Нет попыток для архивации')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Перенесено попыток: {archived} в {path}'))
@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from mailing_app.imports import import_clients
+from users.models import CustomUser
+
+class Command(BaseCommand):
+    help = 'Импортирует клиентов из CSV-файла (email, full_name, comment)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV-файлу или «-» для stdin')
+        parser.add_argument('--owner', required=True, help='Email владельца клиентов')
+        parser.add_argument('--chunk-size', type=int, help='Размер пачки для bulk_create')
+        parser.add_argument('--encoding', default='utf-8-sig')
+
+    def handle(self, *args, **options):
+        try:
+            owner = CustomUser.objects.get(email=options['owner'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f'Пользователь {options["owner"]} не найден.')
+
+        if options['path'] == '-':
+            result = import_clients(sys.stdin, owner, options['chunk_size'])
+        else:
+            try:
+                with open(options['path'], newline='', encoding=options['encoding']) as f:
+                    result = import_clients(f, owner, options['chunk_size'])
+            except OSError as e:
+                raise CommandError(f'Не удалось открыть файл: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Импорт завершён. {result}'))
@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from mailing_app.stats import rebuild_daily_stats
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневную статистику рассылок по таблице попыток'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Пересчитать начиная с даты (ГГГГ-ММ-ДД)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД.')
+        created = rebuild_daily_stats(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Готово. Строк статистики: {created}'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from mailing_app.jobs import claim_next_job, run_job, run_retries
+from mailing_app.shards import claim_shard, run_shard
+
+class Command(BaseCommand):
+    help = 'Обрабатывает очередь рассылок и очередь повторов после временных ошибок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Пауза между опросами пустой очереди, сек.')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать текущую очередь и выйти')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Обработчик очереди рассылок запущен')
+        try:
+            while True:
+                retried = run_retries()
+                if retried:
+                    self.stdout.write(f'Повторная отправка: {retried} писем')
+                shard = claim_shard()
+                if shard is not None:
+                    self.stdout.write(f'Шард #{shard.pk} рассылки #{shard.mailing_id}...')
+                    run_shard(shard)
+                    continue
+                job = claim_next_job()
+                if job is None:
+                    if retried:
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                self.stdout.write(f'Задача #{job.pk}: рассылка #{job.mailing_id}...')
+                run_job(job)
+                if job.status == 'Ошибка':
+                    self.stdout.write(self.style.ERROR(f'Задача #{job.pk}: {job.error}'))
+                elif job.status == 'В очереди':
+                    self.stdout.write(f'Задача #{job.pk} прервана и возвращена в очередь')
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'Задача #{job.pk} выполнена'))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write('Обработчик остановлен')
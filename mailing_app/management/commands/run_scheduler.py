@@ -0,0 +1,45 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from mailing_app.jobs import run_retries
+from mailing_app.scheduler import claim_due_mailing, finish_expired_mailings, run_due_mailing
+
+class Command(BaseCommand):
+    help = ('Запускает рассылки по времени начала, завершает их по времени окончания '
+            'и повторяет письма после временных ошибок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=10.0,
+                            help='Пауза между проверками расписания, сек.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество параллельных потоков отправки')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать наступившие рассылки и выйти')
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+        previous_handler = signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+        self.stdout.write('Планировщик рассылок запущен')
+        try:
+            while not stop_event.is_set():
+                finished = finish_expired_mailings()
+                if finished:
+                    self.stdout.write(f'Завершено рассылок по времени: {finished}')
+                retried = run_retries()
+                if retried:
+                    self.stdout.write(f'Повторная отправка: {retried} писем')
+                mailing = claim_due_mailing()
+                if mailing is None:
+                    if retried:
+                        continue
+                    if options['once']:
+                        break
+                    stop_event.wait(options['poll_interval'])
+                    continue
+                self.stdout.write(f'Рассылка #{mailing.pk} запущена')
+                run_due_mailing(mailing, workers=options['workers'], stop_event=stop_event)
+                self.stdout.write(f'Рассылка #{mailing.pk}: {mailing.status}')
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        self.stdout.write('Планировщик остановлен')
@@ -1,45 +1,66 @@
+import signal
+import threading
+
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from mailing_app.models import Mailing, Attempt
-from django.core.mail import send_mail
+from mailing_app.models import Mailing
+from mailing_app.jobs import drain_retries
+from mailing_app.services import send_mailing
 
 class Command(BaseCommand):
     help = 'Отправляет рассылку по указанному ID'
 
     def add_arguments(self, parser):
         parser.add_argument('mailing_id', type=int)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество параллельных потоков отправки')
+        parser.add_argument('--all', action='store_true',
+                            help='Отправить всем клиентам, не пропуская тех, у кого уже есть итог отправки')
+        parser.add_argument('--wait-retries', action='store_true',
+                            help='Не выходить, пока не будут повторены письма после временных ошибок')
+        parser.add_argument('--async', dest='use_async', action='store_true',
+                            help='Отправлять в одном потоке через asyncio с пулом SMTP-соединений')
+        parser.add_argument('--connections', type=int, default=settings.MAILING_ASYNC_POOL_SIZE,
+                            help='Размер пула SMTP-соединений в режиме --async')
 
     def handle(self, *args, **options):
         mailing_id = options['mailing_id']
+        if options['workers'] < 1:
+            raise CommandError('--workers должно быть не меньше 1.')
+        if options['connections'] < 1:
+            raise CommandError('--connections должно быть не меньше 1.')
         try:
             mailing = Mailing.objects.get(pk=mailing_id)
         except Mailing.DoesNotExist:
             raise CommandError(f'Рассылка с ID {mailing_id} не найдена.')
 
-        self.stdout.write(f'Отправка рассылки #{mailing_id}...')
+        stop_event = threading.Event()
+        previous_handler = signal.signal(signal.SIGINT, lambda *args: stop_event.set())
 
-        for client in mailing.clients.all():
-            try:
-                send_mail(
-                    subject=mailing.message.subject,
-                    message=mailing.message.body,
-                    from_email='noreply@example.com',
-                    recipient_list=[client.email],
-                    fail_silently=False,
-                )
-                Attempt.objects.create(
-                    mailing=mailing,
-                    status='Успешно',
-                    server_response='Письмо отправлено успешно'
-                )
-                self.stdout.write(f'✅ {client.email} — отправлено')
-            except Exception as e:
-                Attempt.objects.create(
-                    mailing=mailing,
-                    status='Не успешно',
-                    server_response=str(e)
-                )
-                self.stdout.write(f'❌ {client.email} — ошибка: {e}')
+        self.stdout.write(f'Отправка рассылки #{mailing_id}...')
+        try:
+            send_mailing(mailing, on_result=self.report,
+                         workers=options['workers'], stop_event=stop_event,
+                         resume=not options['all'],
+                         connections=options['connections'] if options['use_async'] else None)
+            if options['wait_retries'] and not stop_event.is_set():
+                self.stdout.write('Повтор писем после временных ошибок...')
+                drain_retries(mailing, on_result=self.report, stop_event=stop_event)
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        if stop_event.is_set():
+            self.stdout.write(self.style.WARNING('Рассылка прервана'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Рассылка завершена'))
+        retries = mailing.retries.count()
+        if retries:
+            self.stdout.write(self.style.WARNING(
+                f'Ждут повтора: {retries} писем. Их отправит run_mail_worker или '
+                f'run_scheduler, либо запустите команду с --wait-retries'
+            ))
 
-        mailing.status = 'Запущена'
-        mailing.save()
-        self.stdout.write(self.style.SUCCESS('Рассылка завершена'))
+    def report(self, client, ok, response):
+        if ok:
+            self.stdout.write(f'✅ {client.email} — отправлено')
+        else:
+            self.stdout.write(f'❌ {client.email} — ошибка: {response}')
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0004_alter_client_options_alter_mailing_options_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SendJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("В очереди", "В очереди"),
+                            ("Выполняется", "Выполняется"),
+                            ("Выполнено", "Выполнено"),
+                            ("Ошибка", "Ошибка"),
+                        ],
+                        default="В очереди",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("error", models.TextField(blank=True)),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="jobs",
+                        to="mailing_app.mailing",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created_at"],
+            },
+        ),
+    ]
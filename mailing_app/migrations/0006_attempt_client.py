@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0005_sendjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attempt",
+            name="client",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to="mailing_app.client",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["mailing", "client"], name="attempt_mailing_client_idx"
+            ),
+        ),
+    ]
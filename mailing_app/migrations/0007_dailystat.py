@@ -0,0 +1,89 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+
+
+def fill_daily_stats(apps, schema_editor):
+    Attempt = apps.get_model("mailing_app", "Attempt")
+    DailyStat = apps.get_model("mailing_app", "DailyStat")
+    rows = (
+        Attempt.objects.annotate(day=TruncDate("timestamp"))
+        .values("mailing_id", "mailing__owner_id", "day")
+        .annotate(
+            success=Count("pk", filter=Q(status="Успешно")),
+            fail=Count("pk", filter=Q(status="Не успешно")),
+        )
+        .order_by()
+    )
+    DailyStat.objects.bulk_create(
+        DailyStat(
+            mailing_id=row["mailing_id"],
+            owner_id=row["mailing__owner_id"],
+            day=row["day"],
+            success_count=row["success"],
+            fail_count=row["fail"],
+        )
+        for row in rows.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0006_attempt_client"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("success_count", models.PositiveIntegerField(default=0)),
+                ("fail_count", models.PositiveIntegerField(default=0)),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="mailing_app.mailing",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "day"], name="dailystat_owner_day_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("mailing", "day"), name="dailystat_mailing_day_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0007_dailystat"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["mailing", "status"], name="attempt_mailing_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["mailing", "timestamp", "id"], name="attempt_mailing_ts_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(fields=["timestamp", "id"], name="attempt_ts_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                fields=["owner", "status"], name="mailing_owner_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                fields=["status", "start_time"], name="mailing_status_start_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sendjob",
+            index=models.Index(
+                fields=["status", "created_at"], name="sendjob_status_created_idx"
+            ),
+        ),
+    ]
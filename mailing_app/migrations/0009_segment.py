@@ -0,0 +1,90 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0008_hot_query_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="client",
+            name="created_at",
+            field=models.DateTimeField(
+                auto_now_add=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="mailing",
+            name="clients",
+            field=models.ManyToManyField(blank=True, to="mailing_app.client"),
+        ),
+        migrations.CreateModel(
+            name="Segment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                (
+                    "email_domain",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Домен email"
+                    ),
+                ),
+                (
+                    "comment_contains",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="Комментарий содержит"
+                    ),
+                ),
+                (
+                    "created_from",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Добавлен с"
+                    ),
+                ),
+                (
+                    "created_to",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Добавлен по"
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="segments",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="mailing",
+            name="segment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="mailings",
+                to="mailing_app.segment",
+                verbose_name="Сегмент",
+            ),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0009_segment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Suppression",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.EmailField(max_length=254, unique=True)),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("Отписка", "Отписка"),
+                            ("Недоставляемый адрес", "Недоставляемый адрес"),
+                            ("Жалоба", "Жалоба"),
+                        ],
+                        default="Отписка",
+                        max_length=30,
+                    ),
+                ),
+                ("comment", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
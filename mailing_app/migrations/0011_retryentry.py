@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0010_suppression"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RetryEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("retry_count", models.PositiveIntegerField(default=1)),
+                ("next_attempt_at", models.DateTimeField()),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "client",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="retries",
+                        to="mailing_app.client",
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="retries",
+                        to="mailing_app.mailing",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["next_attempt_at"], name="retryentry_next_attempt_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("mailing", "client"),
+                        name="retryentry_mailing_client_uniq",
+                    )
+                ],
+            },
+        ),
+    ]
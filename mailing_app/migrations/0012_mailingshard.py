@@ -0,0 +1,61 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0011_retryentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("start_id", models.BigIntegerField(blank=True, null=True)),
+                ("end_id", models.BigIntegerField(blank=True, null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Ожидает", "Ожидает"),
+                            ("Выполняется", "Выполняется"),
+                            ("Готово", "Готово"),
+                        ],
+                        default="Ожидает",
+                        max_length=20,
+                    ),
+                ),
+                ("lease_owner", models.CharField(blank=True, max_length=255)),
+                ("lease_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="mailing_app.mailing",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "lease_expires_at"],
+                        name="shard_status_lease_idx",
+                    )
+                ],
+            },
+        ),
+    ]
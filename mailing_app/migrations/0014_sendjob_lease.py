@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+def drop_duplicate_jobs(apps, schema_editor):
+    """Оставляет по одной незавершённой задаче на рассылку — самую раннюю."""
+    SendJob = apps.get_model("mailing_app", "SendJob")
+    seen = set()
+    duplicates = []
+    active = SendJob.objects.filter(status__in=["В очереди", "Выполняется"])
+    for job in active.order_by("created_at", "pk"):
+        if job.mailing_id in seen:
+            duplicates.append(job.pk)
+        seen.add(job.mailing_id)
+    SendJob.objects.filter(pk__in=duplicates).update(
+        status="Ошибка", error="Дубликат задачи"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0013_deliveryrecord"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sendjob",
+            name="lease_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="sendjob",
+            name="lease_owner",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(drop_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="sendjob",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["В очереди", "Выполняется"])),
+                fields=("mailing",),
+                name="sendjob_active_mailing_uniq",
+            ),
+        ),
+    ]
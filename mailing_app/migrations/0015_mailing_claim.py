@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0014_sendjob_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailing",
+            name="claim_expires_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="mailing",
+            name="claim_owner",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:41
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0015_mailing_claim"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(
+                django.db.models.functions.text.Lower("email"),
+                name="client_email_lower_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:57
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing_app", "0016_client_email_lower_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="attempt",
+            name="attempt_mailing_status_idx",
+        ),
+    ]
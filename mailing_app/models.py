@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.conf import settings
 
 class Client(models.Model):
@@ -11,6 +12,7 @@ class Client(models.Model):
         related_name='clients',
         verbose_name='Владелец'
     )
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.full_name} <{self.email}>"
@@ -19,6 +21,10 @@ class Client(models.Model):
         permissions = [
             ('can_manage_clients', 'Может управлять клиентами'),
         ]
+        indexes = [
+            # Поиск дубликатов адресов без учёта регистра при импорте
+            models.Index(Lower('email'), name='client_email_lower_idx'),
+        ]
 
 class Message(models.Model):
     subject = models.CharField(max_length=255)
@@ -38,6 +44,35 @@ class Message(models.Model):
             ('can_manage_messages', 'Может управлять сообщениями'),
         ]
 
+class Segment(models.Model):
+    name = models.CharField(max_length=255)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='segments',
+        verbose_name='Владелец'
+    )
+    email_domain = models.CharField(max_length=255, blank=True, verbose_name='Домен email')
+    comment_contains = models.CharField(max_length=255, blank=True, verbose_name='Комментарий содержит')
+    created_from = models.DateTimeField(null=True, blank=True, verbose_name='Добавлен с')
+    created_to = models.DateTimeField(null=True, blank=True, verbose_name='Добавлен по')
+
+    def __str__(self):
+        return self.name
+
+    def resolve(self):
+        """Клиенты владельца, подходящие под правила сегмента, на текущий момент."""
+        clients = Client.objects.filter(owner_id=self.owner_id)
+        if self.email_domain:
+            clients = clients.filter(email__iendswith='@' + self.email_domain.lstrip('@'))
+        if self.comment_contains:
+            clients = clients.filter(comment__icontains=self.comment_contains)
+        if self.created_from:
+            clients = clients.filter(created_at__gte=self.created_from)
+        if self.created_to:
+            clients = clients.filter(created_at__lte=self.created_to)
+        return clients
+
 class Mailing(models.Model):
     STATUS_CHOICES = [
         ('Создана', 'Создана'),
@@ -49,16 +84,34 @@ class Mailing(models.Model):
     end_time = models.DateTimeField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Создана')
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
-    clients = models.ManyToManyField(Client)
+    clients = models.ManyToManyField(Client, blank=True)
+    segment = models.ForeignKey(
+        Segment, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='mailings', verbose_name='Сегмент'
+    )
     is_active = models.BooleanField(default=True)
+    # Планировщик, отправляющий рассылку, и до какого времени он её держит:
+    # рассылку с истёкшим захватом подбирает другой планировщик
+    claim_owner = models.CharField(max_length=255, blank=True)
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"Рассылка: {self.message.subject} ({self.status})"
 
+    def recipients(self):
+        """Получатели: клиенты сегмента, если он задан, иначе выбранные вручную."""
+        if self.segment_id:
+            return self.segment.resolve()
+        return self.clients.all()
+
     class Meta:
         permissions = [
             ('can_manage_mailings', 'Может управлять рассылками'),
         ]
+        indexes = [
+            models.Index(fields=['owner', 'status'], name='mailing_owner_status_idx'),
+            models.Index(fields=['status', 'start_time'], name='mailing_status_start_idx'),
+        ]
 
 class Attempt(models.Model):
     STATUS_CHOICES = [
@@ -67,9 +120,164 @@ class Attempt(models.Model):
     ]
 
     mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE)
+    client = models.ForeignKey(Client, on_delete=models.SET_NULL, null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     server_response = models.TextField()
 
     def __str__(self):
         return f"{self.mailing} — {self.status} @ {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['mailing', 'client'], name='attempt_mailing_client_idx'),
+            models.Index(fields=['mailing', 'timestamp', 'id'], name='attempt_mailing_ts_idx'),
+            models.Index(fields=['timestamp', 'id'], name='attempt_ts_idx'),
+        ]
+
+class SendJob(models.Model):
+    STATUS_CHOICES = [
+        ('В очереди', 'В очереди'),
+        ('Выполняется', 'Выполняется'),
+        ('Выполнено', 'Выполнено'),
+        ('Ошибка', 'Ошибка'),
+    ]
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='В очереди')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    # Обработчик, выполняющий задачу, и до какого времени он её держит:
+    # задачу с истёкшей арендой подбирает другой обработчик
+    lease_owner = models.CharField(max_length=255, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    ACTIVE_STATUSES = ['В очереди', 'Выполняется']
+
+    def __str__(self):
+        return f"Задача #{self.pk}: {self.mailing} ({self.status})"
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='sendjob_status_created_idx'),
+        ]
+        constraints = [
+            # Не больше одной незавершённой задачи на рассылку
+            models.UniqueConstraint(
+                fields=['mailing'],
+                condition=models.Q(status__in=['В очереди', 'Выполняется']),
+                name='sendjob_active_mailing_uniq',
+            ),
+        ]
+
+class DailyStat(models.Model):
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_stats',
+        verbose_name='Владелец'
+    )
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    success_count = models.PositiveIntegerField(default=0)
+    fail_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.mailing} — {self.day}: {self.success_count}/{self.fail_count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'day'], name='dailystat_mailing_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'day'], name='dailystat_owner_day_idx'),
+        ]
+
+class DeliveryRecord(models.Model):
+    """Итог отправки клиенту, сохранённый при переносе его попыток в архив.
+
+    По нему продолжение отправки узнаёт, кому письмо уже ушло, когда самих
+    попыток в таблице больше нет.
+    """
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='delivery_records')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='delivery_records')
+    status = models.CharField(max_length=20, choices=Attempt.STATUS_CHOICES)
+
+    def __str__(self):
+        return f"{self.mailing} — {self.client} ({self.status})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['mailing', 'client', 'status'], name='deliveryrecord_mailing_client_uniq'
+            ),
+        ]
+
+class Suppression(models.Model):
+    REASON_CHOICES = [
+        ('Отписка', 'Отписка'),
+        ('Недоставляемый адрес', 'Недоставляемый адрес'),
+        ('Жалоба', 'Жалоба'),
+    ]
+
+    email = models.EmailField(unique=True)
+    reason = models.CharField(max_length=30, choices=REASON_CHOICES, default='Отписка')
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.email} ({self.reason})"
+
+class RetryEntry(models.Model):
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='retries')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='retries')
+    retry_count = models.PositiveIntegerField(default=1)
+    next_attempt_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.mailing} — {self.client} (попытка {self.retry_count + 1})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['mailing', 'client'], name='retryentry_mailing_client_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='retryentry_next_attempt_idx'),
+        ]
+
+class MailingShard(models.Model):
+    STATUS_CHOICES = [
+        ('Ожидает', 'Ожидает'),
+        ('Выполняется', 'Выполняется'),
+        ('Готово', 'Готово'),
+    ]
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name='shards')
+    # Диапазон id клиентов [start_id, end_id); пустая граница — без ограничения
+    start_id = models.BigIntegerField(null=True, blank=True)
+    end_id = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Ожидает')
+    lease_owner = models.CharField(max_length=255, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.mailing}: клиенты {self.start_id or ''}–{self.end_id or ''} ({self.status})"
+
+    def clients_in(self, clients):
+        """Оставляет в выборке клиентов только попадающих в диапазон шарда."""
+        if self.start_id is not None:
+            clients = clients.filter(id__gte=self.start_id)
+        if self.end_id is not None:
+            clients = clients.filter(id__lt=self.end_id)
+        return clients
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'lease_expires_at'], name='shard_status_lease_idx'),
+        ]
@@ -0,0 +1,100 @@
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """Страница keyset-пагинации: объекты и курсоры соседних страниц."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise BadRequest('Некорректный курсор страницы')
+
+
+def keyset_paginate(queryset, ordering, cursor, per_page, before=None):
+    """Возвращает страницу, начинающуюся сразу после строки из ``cursor``.
+
+    ``ordering`` — поля сортировки с одинаковым направлением, последнее из них
+    должно быть уникальным (обычно ``id``). Вместо OFFSET используется
+    условие «строго после курсора», поэтому любая страница стоит как первая.
+    С ``before`` возвращается страница, которая заканчивается прямо перед
+    строкой из этого курсора, — так работает переход назад.
+    """
+    names = [name.lstrip('-') for name in ordering]
+    descending = ordering[0].startswith('-')
+    backward = bool(before)
+    if backward:
+        cursor = before
+        ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        fields = [queryset.model._meta.get_field(name) for name in names]
+        values = decode_cursor(cursor, fields)
+        lookup = 'lt' if descending != backward else 'gt'
+        condition = Q()
+        for i, name in enumerate(names):
+            equal = {n: v for n, v in zip(names[:i], values[:i])}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[i]})
+        queryset = queryset.filter(condition)
+    rows = list(queryset[:per_page + 1])
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backward:
+        rows.reverse()
+    if not rows:
+        return KeysetPage(rows, None)
+    first = encode_cursor([getattr(rows[0], name) for name in names])
+    last = encode_cursor([getattr(rows[-1], name) for name in names])
+    if backward:
+        return KeysetPage(rows, last, first if more else None)
+    return KeysetPage(rows, last if more else None, first if cursor else None)
+
+
+class KeysetPaginationMixin:
+    """Подключает keyset-пагинацию к ``ListView`` вместо постраничной с OFFSET."""
+
+    paginate_by = 50
+    keyset_ordering = ('-id',)
+    cursor_kwarg = 'after'
+    previous_cursor_kwarg = 'before'
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset_paginate(
+            queryset, self.keyset_ordering, self.request.GET.get(self.cursor_kwarg), page_size,
+            before=self.request.GET.get(self.previous_cursor_kwarg),
+        )
+        return None, page, page.object_list, page.has_next
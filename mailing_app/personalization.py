@@ -0,0 +1,48 @@
+import re
+from functools import lru_cache
+
+PLACEHOLDER_RE = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+CLIENT_FIELDS = ('full_name', 'email', 'comment')
+
+
+class CompiledTemplate:
+    """Шаблон темы или текста письма, разобранный один раз.
+
+    Подстановки ``{{ full_name }}`` и т. п. превращаются в строку формата
+    ``str.format`` с доступом к атрибутам клиента, поэтому рендер для
+    получателя — один вызов ``format`` без промежуточных списков.
+    Неизвестные подстановки остаются в тексте как есть.
+    """
+
+    __slots__ = ('text', 'fmt', 'is_static')
+
+    def __init__(self, text):
+        self.text = text
+        parts = []
+        position = 0
+        self.is_static = True
+        for match in PLACEHOLDER_RE.finditer(text):
+            field = match.group(1)
+            if field not in CLIENT_FIELDS:
+                continue
+            parts.append(_escape(text[position:match.start()]))
+            parts.append(f'{{client.{field}}}')
+            position = match.end()
+            self.is_static = False
+        parts.append(_escape(text[position:]))
+        self.fmt = ''.join(parts)
+
+    def render(self, client):
+        if self.is_static:
+            return self.text
+        return self.fmt.format(client=client)
+
+
+def _escape(literal):
+    return literal.replace('{', '{{').replace('}', '}}')
+
+
+@lru_cache(maxsize=256)
+def compile_template(text):
+    """Компилирует шаблон; результат кешируется по содержимому текста."""
+    return CompiledTemplate(text)
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from redis import Redis
+from redis.exceptions import RedisError
+
+# Списывает жетоны из всех корзин KEYS разом или не списывает ничего. Для
+# каждой корзины в ARGV идут скорость (жетонов в мс), ёмкость и сколько
+# жетонов списать. Возвращает, сколько миллисекунд ждать до следующей
+# попытки (0 — разрешено).
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local requested = tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    levels[i] = tokens
+    if tokens < requested then
+        wait = math.max(wait, math.ceil((requested - tokens) / rate))
+    end
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local tokens = levels[i]
+    if wait == 0 then
+        tokens = tokens - tonumber(ARGV[i * 3])
+    end
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate) + 1000)
+end
+return wait
+"""
+
+
+class LocalBuckets:
+    """Те же корзины в памяти процесса — когда Redis нет или он недоступен."""
+
+    def __init__(self):
+        self.levels = {}
+        self.lock = threading.Lock()
+
+    def take(self, buckets):
+        now = time.monotonic() * 1000
+        with self.lock:
+            levels = {}
+            wait = 0
+            for key, (rate, capacity, requested) in buckets.items():
+                tokens, ts = self.levels.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - ts) * rate)
+                levels[key] = tokens
+                if tokens < requested:
+                    wait = max(wait, (requested - tokens) / rate)
+            for key, tokens in levels.items():
+                if not wait:
+                    tokens -= buckets[key][2]
+                self.levels[key] = (tokens, now)
+        return wait
+
+
+@lru_cache
+def redis_client(url):
+    """Клиент Redis на адрес ``url``, один на процесс со своим пулом соединений."""
+    return Redis.from_url(url)
+
+
+class RedisBuckets:
+    """Корзины в Redis: общие для всех процессов отправки."""
+
+    def __init__(self, client):
+        self.script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def take(self, buckets):
+        args = [value for bucket in buckets.values() for value in bucket]
+        return self.script(keys=list(buckets), args=args)
+
+
+class RateLimiter:
+    """Ограничитель скорости отправки на основе корзин жетонов.
+
+    Одна корзина на учётную запись SMTP и по одной на домен получателя.
+    Лимиты задаются в письмах в минуту, а ёмкость корзины — запасом на
+    ``MAILING_RATE_LIMIT_BURST`` секунд, так что дольше этого отправка не
+    может идти быстрее лимита. Корзины хранятся в Redis по адресу
+    ``MAILING_RATE_LIMIT_REDIS_URL``, а если он не задан — в памяти процесса.
+    """
+
+    def __init__(self, account_limit=0, domain_limit=0, domain_limits=None, burst=None):
+        self.account = settings.EMAIL_HOST_USER or settings.EMAIL_HOST
+        self.account_limit = account_limit
+        self.domain_limit = domain_limit
+        self.domain_limits = domain_limits or {}
+        self.burst = burst or settings.MAILING_RATE_LIMIT_BURST
+        self.local = LocalBuckets()
+        self.backend = self.local
+        if settings.MAILING_RATE_LIMIT_REDIS_URL:
+            self.backend = RedisBuckets(redis_client(settings.MAILING_RATE_LIMIT_REDIS_URL))
+
+    @classmethod
+    def from_settings(cls):
+        """Ограничитель по настройкам или ``None``, если ни один лимит не задан."""
+        limiter = cls(
+            account_limit=settings.MAILING_RATE_LIMIT_ACCOUNT,
+            domain_limit=settings.MAILING_RATE_LIMIT_DOMAIN,
+            domain_limits=settings.MAILING_RATE_LIMIT_DOMAINS,
+        )
+        return limiter if limiter.limits else None
+
+    @property
+    def limits(self):
+        limits = [self.account_limit, self.domain_limit, *self.domain_limits.values()]
+        return [limit for limit in limits if limit]
+
+    def bucket(self, per_minute, requested):
+        rate = per_minute / 60000
+        return rate, max(1.0, per_minute / 60 * self.burst), requested
+
+    def domain_limit_for(self, domain):
+        return self.domain_limits.get(domain, self.domain_limit)
+
+    def buckets(self, emails):
+        """Корзины, из которых списывается пачка писем на адреса ``emails``."""
+        buckets = {}
+        if self.account_limit:
+            buckets[f'ratelimit:account:{self.account}'] = self.bucket(self.account_limit, len(emails))
+        domains = Counter(email.rpartition('@')[2].lower() for email in emails)
+        for domain, count in domains.items():
+            limit = self.domain_limit_for(domain)
+            if limit:
+                buckets[f'ratelimit:domain:{domain}'] = self.bucket(limit, count)
+        return buckets
+
+    @property
+    def batch_size(self):
+        """Сколько писем разрешать за раз: не больше ёмкости самой маленькой корзины."""
+        capacity = min(self.bucket(limit, 0)[1] for limit in self.limits)
+        return max(1, min(settings.MAILING_RATE_LIMIT_BATCH, int(capacity)))
+
+    def reserve(self, emails):
+        """Списывает жетоны на пачку писем разом; возвращает паузу в секундах (0 — можно)."""
+        buckets = self.buckets(emails)
+        if not buckets:
+            return 0
+        try:
+            wait = self.backend.take(buckets)
+        except RedisError:
+            wait = self.local.take(buckets)
+        return wait / 1000
+
+    def acquire(self, emails, should_stop):
+        """Ждёт разрешения на отправку ``emails``; ``False``, если отправку остановили."""
+        while True:
+            wait = self.reserve(emails)
+            if not wait:
+                return True
+            if should_stop():
+                return False
+            time.sleep(min(wait, 1.0))
+
+    async def aacquire(self, emails, should_stop):
+        """Асинхронный ``acquire``: обращение к Redis идёт в отдельном потоке."""
+        while True:
+            wait = await asyncio.to_thread(self.reserve, emails)
+            if not wait:
+                return True
+            if should_stop():
+                return False
+            await asyncio.sleep(min(wait, 1.0))
@@ -0,0 +1,58 @@
+from django.db import transaction
+
+from .cache import bump_owner_versions
+from .models import Mailing
+
+
+def parse_id_ranges(value):
+    """Разбирает строку вида ``1-500, 731`` в список пар (первый, последний)."""
+    ranges = []
+    for part in value.replace(' ', '').split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < 1 or last < first:
+            raise ValueError(part)
+        ranges.append((first, last))
+    return ranges
+
+
+def format_id_ranges(ids):
+    """Сворачивает отсортированные id в строку диапазонов для формы."""
+    parts = []
+    first = last = None
+    for pk in ids:
+        if last is not None and pk == last + 1:
+            last = pk
+            continue
+        if first is not None:
+            parts.append(f'{first}-{last}' if first != last else str(first))
+        first = last = pk
+    if first is not None:
+        parts.append(f'{first}-{last}' if first != last else str(first))
+    return ', '.join(parts)
+
+
+def set_mailing_clients(mailing, clients, chunk_size=2000):
+    """Заменяет клиентов рассылки на ``clients`` пачечными запросами.
+
+    Лишние связи удаляются одним DELETE, недостающие добавляются через
+    ``bulk_create`` без загрузки объектов клиентов. ``m2m_changed`` при этом
+    не отправляется, поэтому кеш владельца сбрасывается здесь.
+    """
+    through = Mailing.clients.through
+    with transaction.atomic():
+        through.objects.filter(mailing=mailing).exclude(
+            client__in=clients.values('pk')
+        ).delete()
+        missing = clients.exclude(mailing=mailing).values_list('pk', flat=True)
+        buffer = []
+        for client_id in missing.iterator(chunk_size=chunk_size):
+            buffer.append(through(mailing_id=mailing.pk, client_id=client_id))
+            if len(buffer) >= chunk_size:
+                through.objects.bulk_create(buffer, ignore_conflicts=True)
+                buffer = []
+        through.objects.bulk_create(buffer, ignore_conflicts=True)
+    bump_owner_versions([mailing.owner_id])
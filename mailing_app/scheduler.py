@@ -0,0 +1,74 @@
+import threading
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .cache import bump_owner_versions
+from .leases import WORKER_ID, Lease
+from .models import Mailing, MailingShard, SendJob
+from .services import send_mailing
+
+SCHEDULER_LEASE = Lease(Mailing, 'Создана', 'Запущена', 'MAILING_SCHEDULER_LEASE',
+                        owner_field='claim_owner', expires_field='claim_expires_at')
+
+
+def claim_due_mailing(worker_id=WORKER_ID):
+    """Забирает одну активную рассылку, время которой наступило.
+
+    Рассылка переводится в статус «Запущена» и захватывается на
+    ``MAILING_SCHEDULER_LEASE`` секунд в той же транзакции, а строки,
+    заблокированные другими планировщиками, пропускаются. Запущенная
+    рассылка с истёкшим захватом — её планировщик упал — забирается снова.
+    Рассылки, которые стоят в очереди обработчиков или отправляются по
+    шардам, планировщик не трогает.
+    """
+    now = timezone.now()
+    queued = SendJob.objects.filter(mailing=OuterRef('pk'), status__in=SendJob.ACTIVE_STATUSES)
+    sharded = MailingShard.objects.filter(mailing=OuterRef('pk')).exclude(status='Готово')
+    due = Mailing.objects.filter(
+        ~Exists(queued), ~Exists(sharded),
+        is_active=True, start_time__lte=now, end_time__gt=now,
+    ).order_by('start_time')
+    return SCHEDULER_LEASE.claim(due, worker_id)
+
+
+def renew_claim(mailing):
+    """Продлевает захват; ``False``, если рассылку уже забрал другой планировщик."""
+    return SCHEDULER_LEASE.renew(mailing)
+
+
+def finish_expired_mailings():
+    """Завершает рассылки, у которых прошло время окончания.
+
+    Рассылки, которые планировщик ещё держит, он завершит сам.
+    """
+    now = timezone.now()
+    expired = Mailing.objects.filter(
+        status__in=['Создана', 'Запущена'], end_time__lte=now
+    ).exclude(claim_expires_at__gt=now)
+    owner_ids = set(expired.values_list('owner_id', flat=True))
+    finished = expired.update(status='Завершена', claim_owner='', claim_expires_at=None)
+    bump_owner_versions(owner_ids)
+    return finished
+
+
+def run_due_mailing(mailing, on_result=None, workers=1, stop_event=None):
+    """Отправляет рассылку до её времени окончания, продлевая захват.
+
+    Прерванная раньше срока рассылка возвращается в статус «Создана», чтобы
+    её подхватил следующий проход планировщика. Если захват перехватил
+    другой планировщик, отправка останавливается, а статус не меняется.
+    """
+    stop_event = stop_event or threading.Event()
+    keeper = SCHEDULER_LEASE.keeper(mailing, stop_event)
+    status = 'Создана'
+    try:
+        with keeper:
+            send_mailing(mailing, on_result=on_result, workers=workers,
+                         stop_event=stop_event, deadline=mailing.end_time)
+        if not stop_event.is_set() or timezone.now() >= mailing.end_time:
+            status = 'Завершена'
+    finally:
+        if not keeper.lost:
+            SCHEDULER_LEASE.release(mailing, status)
+            bump_owner_versions([mailing.owner_id])
@@ -0,0 +1,521 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from operator import attrgetter
+from email.utils import formatdate, make_msgid
+from datetime import timedelta
+from smtplib import (
+    SMTPException,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
+    SMTPServerDisconnected,
+)
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.smtp import EmailBackend as SMTPEmailBackend
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+from django.db import connection as db_connection, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from .asyncsmtp import EmailBackend as AsyncSMTPBackend
+from .cache import bump_owner_versions
+from .models import Attempt, DeliveryRecord, RetryEntry, Suppression
+from .personalization import compile_template
+from .ratelimit import RateLimiter
+from .stats import record_attempts
+from .suppression import SuppressionIndex
+
+FROM_EMAIL = 'noreply@example.com'
+# Отказы получателю, после которых адрес попадает в список подавления
+BOUNCE_CODES = (550, 551, 553)
+
+
+class MailSender:
+    """Отправляет письма через одно соединение с почтовым сервером.
+
+    Соединение открывается при первой отправке, переоткрывается при обрыве
+    и после каждых ``batch_size`` писем.
+    """
+
+    def __init__(self, connection=None, batch_size=None):
+        self.connection = connection or get_connection(fail_silently=False)
+        self.batch_size = batch_size or settings.MAILING_SMTP_BATCH_SIZE
+        self.is_open = False
+        self.sent_in_batch = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        self.connection.open()
+        self.is_open = True
+        self.sent_in_batch = 0
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        try:
+            self.connection.close()
+        except OSError:
+            pass
+
+    def reconnect(self):
+        self.close()
+        self.open()
+
+    @property
+    def supports_raw(self):
+        return isinstance(self.connection, SMTPEmailBackend)
+
+    def send(self, message):
+        message.connection = self.connection
+        self._deliver(lambda: self.connection.send_messages([message]))
+
+    def send_prepared(self, prepared, email):
+        """Отправляет заранее закодированное письмо одному получателю.
+
+        Бэкендам, отличным от SMTP, передаётся обычный ``EmailMessage``.
+        """
+        if not self.supports_raw:
+            return self.send(prepared.to_email_message(email))
+        recipient = sanitize_address(email, prepared.encoding)
+        self._deliver(lambda: self.connection.connection.sendmail(
+            prepared.envelope_from, [recipient], prepared.for_recipient(recipient)
+        ))
+
+    def _deliver(self, send):
+        if not self.is_open:
+            self.open()
+        elif self.sent_in_batch >= self.batch_size:
+            self.reconnect()
+        try:
+            send()
+        except (SMTPServerDisconnected, ConnectionError, TimeoutError):
+            self.reconnect()
+            send()
+        self.sent_in_batch += 1
+
+
+class PreparedMessage:
+    """Письмо без персонализации, закодированное один раз на всю рассылку.
+
+    Заголовки и тело сериализуются в байты заранее; для каждого получателя
+    к ним дописываются только ``To``, ``Date`` на момент отправки и
+    собственный ``Message-ID``.
+    """
+
+    def __init__(self, subject, body, from_email=FROM_EMAIL):
+        self.subject = subject
+        self.body = body
+        message = build_message(subject, body, '')
+        self.encoding = message.encoding or settings.DEFAULT_CHARSET
+        self.envelope_from = sanitize_address(message.from_email, self.encoding)
+        mime = message.message()
+        del mime['To']
+        del mime['Message-ID']
+        del mime['Date']
+        self.payload = mime.as_bytes(linesep='\r\n')
+
+    def for_recipient(self, recipient):
+        return b''.join((
+            b'To: ', recipient.encode('ascii'), b'\r\n',
+            b'Date: ', formatdate(localtime=settings.EMAIL_USE_LOCALTIME).encode('ascii'), b'\r\n',
+            b'Message-ID: ', make_msgid(domain=DNS_NAME).encode('ascii'), b'\r\n',
+            self.payload,
+        ))
+
+    def to_email_message(self, email):
+        return build_message(self.subject, self.body, email)
+
+
+class AttemptWriter:
+    """Копит попытки рассылки и сохраняет их пачками через ``bulk_create``.
+
+    Вместе с попытками в тот же буфер попадают записи очереди повторов и
+    адреса для списка подавления. Буфер сбрасывается при заполнении и при
+    выходе из контекста, в том числе по исключению. Один экземпляр можно
+    использовать из нескольких потоков.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.MAILING_ATTEMPT_CHUNK_SIZE
+        self.buffer = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def add(self, mailing, client, status, server_response):
+        self.push(Attempt(
+            mailing=mailing,
+            client=client,
+            status=status,
+            server_response=server_response,
+        ))
+
+    def push(self, *records):
+        batch = self.collect(*records)
+        if batch:
+            self.save(batch)
+
+    def collect(self, *records):
+        """Кладёт записи в буфер и возвращает пачку к сохранению, если он заполнен."""
+        with self.lock:
+            self.buffer.extend(records)
+            if len(self.buffer) < self.chunk_size:
+                return None
+            batch, self.buffer = self.buffer, []
+        return batch
+
+    def flush(self):
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if batch:
+            self.save(batch)
+
+    def save(self, batch):
+        attempts = [record for record in batch if isinstance(record, Attempt)]
+        with transaction.atomic():
+            Attempt.objects.bulk_create(attempts)
+            record_attempts(attempts)
+            RetryEntry.objects.bulk_create(
+                [record for record in batch if isinstance(record, RetryEntry)],
+                ignore_conflicts=True,
+            )
+            Suppression.objects.bulk_create(
+                [record for record in batch if isinstance(record, Suppression)],
+                ignore_conflicts=True,
+            )
+        if attempts:
+            bump_owner_versions({attempt.mailing.owner_id for attempt in attempts})
+
+
+def is_temporary_error(error):
+    """Временная ли ошибка отправки: ответ 4xx или обрыв связи с сервером."""
+    if isinstance(error, SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, SMTPException)
+
+
+def is_bounce(error):
+    """Отказал ли сервер получателю так, что писать на адрес больше не стоит."""
+    return isinstance(error, SMTPRecipientsRefused) and all(
+        code in BOUNCE_CODES for code, _ in error.recipients.values()
+    )
+
+
+def retry_delay(retry_count):
+    """Пауза перед повтором номер ``retry_count``: удваивается с каждым повтором."""
+    seconds = settings.MAILING_RETRY_BASE_DELAY * 2 ** (retry_count - 1)
+    return timedelta(seconds=min(seconds, settings.MAILING_RETRY_MAX_DELAY))
+
+
+def build_message(subject, body, email):
+    return EmailMessage(
+        subject=subject,
+        body=body,
+        from_email=FROM_EMAIL,
+        to=[email],
+    )
+
+
+def pending_recipients(mailing):
+    """Клиенты рассылки без итога отправки, которые не ждут повтора.
+
+    Итог — это доставка или постоянная ошибка: временные ошибки попыткой не
+    записываются, а ставят клиента в очередь повторов.
+    """
+    attempted = Attempt.objects.filter(mailing=mailing, client=OuterRef('pk'))
+    archived = DeliveryRecord.objects.filter(mailing=mailing, client=OuterRef('pk'))
+    queued = RetryEntry.objects.filter(mailing=mailing, client=OuterRef('pk'))
+    return mailing.recipients().filter(~Exists(attempted), ~Exists(archived), ~Exists(queued))
+
+
+def send_mailing(mailing, on_result=None, workers=1, stop_event=None, deadline=None,
+                 resume=True, connections=None, shard=None):
+    """Отправляет рассылку клиентам и записывает попытки.
+
+    По умолчанию клиенты, у которых уже есть итог отправки (письмо доставлено
+    или сервер отказал окончательно), пропускаются, так что прерванная
+    отправка продолжается с последней записанной пачки попыток;
+    ``resume=False`` отправляет всем заново.
+
+    ``on_result(client, ok, response)`` вызывается после каждого письма.
+    При ``workers > 1`` клиенты делятся между потоками по остатку от деления
+    id, и у каждого потока своё SMTP-соединение. Установленный
+    ``stop_event`` прерывает отправку после текущего письма, как и
+    наступление ``deadline``.
+
+    С ``connections`` письма отправляются в одном потоке через asyncio-бэкенд
+    с пулом из стольких SMTP-соединений, а ``workers`` не используется.
+    С ``shard`` отправляются только клиенты из его диапазона id.
+    """
+    recipients = pending_recipients(mailing) if resume else mailing.recipients()
+    if shard is not None:
+        recipients = shard.clients_in(recipients)
+    with AttemptWriter() as writer:
+        dispatch = Dispatch(mailing, writer, on_result, stop_event, deadline)
+        if connections:
+            asyncio.run(dispatch.send_async(recipients, AsyncSMTPBackend(pool_size=connections)))
+        elif workers <= 1:
+            dispatch.send_to(recipients)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(
+                        dispatch.send_partition,
+                        recipients.alias(part=Mod('id', workers)).filter(part=part),
+                    )
+                    for part in range(workers)
+                ]
+                for future in futures:
+                    future.result()
+    mailing.status = 'Запущена'
+    mailing.save(update_fields=['status'])
+
+
+class Dispatch:
+    """Одна отправка рассылки: всё, что готовится один раз и общее для потоков.
+
+    Шаблоны письма компилируются, а список подавления загружается в память
+    при создании, так что цикл отправки не делает запросов на получателя.
+
+    Временные ошибки (4xx, обрыв связи) не записываются попыткой, а ставят
+    клиента в очередь повторов; постоянные записываются один раз, а адрес,
+    которому отказал сервер, попадает в список подавления.
+
+    Если заданы лимиты скорости, перед каждой пачкой писем циклы отправки
+    ждут разрешения у общего ``RateLimiter``.
+    """
+
+    def __init__(self, mailing, writer, on_result=None, stop_event=None, deadline=None,
+                 suppressed=None):
+        self.mailing = mailing
+        self.writer = writer
+        self.on_result = on_result
+        self.stop_event = stop_event or threading.Event()
+        self.deadline = deadline
+        message = mailing.message
+        self.subject = compile_template(message.subject)
+        self.body = compile_template(message.body)
+        self.prepared = None
+        if self.subject.is_static and self.body.is_static:
+            self.prepared = PreparedMessage(message.subject, message.body)
+        self.suppressed = SuppressionIndex.load() if suppressed is None else suppressed
+        self.limiter = RateLimiter.from_settings()
+
+    def should_stop(self):
+        if self.stop_event.is_set():
+            return True
+        if self.deadline and timezone.now() >= self.deadline:
+            self.stop_event.set()
+            return True
+        return False
+
+    def throttled(self, items, email=attrgetter('email')):
+        """Отдаёт ``items`` без подавленных адресов, пачками после разрешения ограничителя.
+
+        Останавливается, как только ``should_stop`` вернёт ``True``.
+        """
+        items = (item for item in items if email(item) not in self.suppressed)
+        size = self.limiter.batch_size if self.limiter else 1
+        while batch := list(islice(items, size)):
+            if not self.release([email(item) for item in batch]):
+                return
+            yield from batch
+
+    async def athrottled(self, clients):
+        """То же, что ``throttled``, для асинхронного итератора клиентов."""
+        size = self.limiter.batch_size if self.limiter else 1
+        batch = []
+        async for client in clients:
+            if client.email in self.suppressed:
+                continue
+            batch.append(client)
+            if len(batch) < size:
+                continue
+            if not await self.arelease([client.email for client in batch]):
+                return
+            for client in batch:
+                yield client
+            batch = []
+        if batch and await self.arelease([client.email for client in batch]):
+            for client in batch:
+                yield client
+
+    def release(self, emails):
+        if self.should_stop():
+            return False
+        return self.limiter is None or self.limiter.acquire(emails, self.should_stop)
+
+    async def arelease(self, emails):
+        if self.should_stop():
+            return False
+        return self.limiter is None or await self.limiter.aacquire(emails, self.should_stop)
+
+    def send_partition(self, recipients):
+        try:
+            self.send_to(recipients)
+        finally:
+            db_connection.close()
+
+    def send_to(self, recipients):
+        with MailSender() as sender:
+            for client in self.throttled(recipients.iterator()):
+                error = self.try_send(sender, client)
+                records = self.outcome(client, error)
+                self.writer.push(*records)
+                self.report(client, error, isinstance(records[0], RetryEntry))
+
+    def retry(self, entries):
+        """Повторяет отправку по записям очереди повторов этой рассылки.
+
+        Возвращает записи, которые нужно удалить, и записи, перенесённые на
+        следующий повтор. После ``MAILING_RETRY_MAX_ATTEMPTS`` повторов и после
+        окончания рассылки временная ошибка записывается как неуспешная попытка.
+        """
+        finished = [entry for entry in entries if entry.client.email in self.suppressed]
+        rescheduled = []
+        if timezone.now() >= self.mailing.end_time:
+            for entry in entries:
+                if entry not in finished:
+                    self.writer.add(
+                        self.mailing, entry.client, 'Не успешно',
+                        f'Рассылка завершена до доставки: {entry.last_error}',
+                    )
+            return entries, rescheduled
+        with MailSender() as sender:
+            for entry in self.throttled(entries, email=attrgetter('client.email')):
+                client = entry.client
+                error = self.try_send(sender, client)
+                if (error is not None and is_temporary_error(error)
+                        and entry.retry_count < settings.MAILING_RETRY_MAX_ATTEMPTS):
+                    entry.retry_count += 1
+                    entry.next_attempt_at = timezone.now() + retry_delay(entry.retry_count)
+                    entry.last_error = str(error)
+                    rescheduled.append(entry)
+                    self.report(client, error, retrying=True)
+                else:
+                    self.writer.push(*self.final_outcome(client, error))
+                    finished.append(entry)
+                    self.report(client, error)
+        return finished, rescheduled
+
+    async def send_async(self, recipients, backend):
+        """Отправляет письма через пул соединений ``backend``.
+
+        В работе держится вдвое больше писем, чем соединений в пуле, чтобы
+        освободившееся соединение сразу получало следующее. Запросы к базе
+        выполняются в отдельном потоке через ``sync_to_async``.
+        """
+        in_flight = set()
+        try:
+            async with backend.pool() as pool:
+                async for client in self.athrottled(recipients.aiterator()):
+                    if len(in_flight) >= pool.size * 2:
+                        done, in_flight = await asyncio.wait(
+                            in_flight, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        await self.record_done(done)
+                    in_flight.add(asyncio.create_task(self.send_one_async(pool, client)))
+                if in_flight:
+                    done, in_flight = await asyncio.wait(in_flight)
+                    await self.record_done(done)
+        finally:
+            # Соединение с базой открыто в потоке sync_to_async — закрываем его там же
+            await sync_to_async(lambda: db_connection.close())()
+
+    async def record_done(self, tasks):
+        for task in tasks:
+            client, error = task.result()
+            records = self.outcome(client, error)
+            batch = self.writer.collect(*records)
+            if batch:
+                await sync_to_async(self.writer.save)(batch)
+            self.report(client, error, isinstance(records[0], RetryEntry))
+
+    def outcome(self, client, error):
+        """Записи, которыми сохраняется результат первой отправки клиенту."""
+        if error is not None and is_temporary_error(error):
+            return [RetryEntry(
+                mailing=self.mailing,
+                client=client,
+                next_attempt_at=timezone.now() + retry_delay(1),
+                last_error=str(error),
+            )]
+        return self.final_outcome(client, error)
+
+    def final_outcome(self, client, error):
+        if error is None:
+            return [Attempt(
+                mailing=self.mailing, client=client, status='Успешно',
+                server_response='Письмо отправлено успешно',
+            )]
+        records = [Attempt(
+            mailing=self.mailing, client=client, status='Не успешно', server_response=str(error),
+        )]
+        if is_bounce(error):
+            records.append(Suppression(
+                email=client.email.strip().lower(),
+                reason='Недоставляемый адрес',
+                comment=str(error),
+            ))
+        return records
+
+    def report(self, client, error, retrying=False):
+        if not self.on_result:
+            return
+        if error is None:
+            self.on_result(client, True, 'Письмо отправлено успешно')
+        elif retrying:
+            self.on_result(client, False, f'{error} (будет повторено)')
+        else:
+            self.on_result(client, False, str(error))
+
+    def try_send(self, sender, client):
+        try:
+            self.send_one(sender, client)
+        except Exception as e:
+            return e
+        return None
+
+    async def send_one_async(self, pool, client):
+        try:
+            if self.prepared:
+                recipient = sanitize_address(client.email, self.prepared.encoding)
+                await pool.sendmail(
+                    self.prepared.envelope_from, [recipient],
+                    self.prepared.for_recipient(recipient),
+                )
+            else:
+                await pool.send_message(build_message(
+                    self.subject.render(client), self.body.render(client), client.email
+                ))
+        except Exception as e:
+            return client, e
+        return client, None
+
+    def send_one(self, sender, client):
+        if self.prepared:
+            sender.send_prepared(self.prepared, client.email)
+        else:
+            sender.send(build_message(
+                self.subject.render(client), self.body.render(client), client.email
+            ))
@@ -0,0 +1,108 @@
+import threading
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .leases import WORKER_ID, Lease
+from .models import Mailing, MailingShard
+from .services import send_mailing
+
+SHARD_LEASE = Lease(MailingShard, 'Ожидает', 'Выполняется', 'MAILING_SHARD_LEASE')
+
+
+def create_shards(mailing, shard_size=None):
+    """Делит клиентов рассылки на диапазоны id по ``shard_size`` клиентов.
+
+    Если у рассылки остались незавершённые шарды, новые не создаются — их
+    дорабатывают. Крайние шарды открыты с одной стороны, чтобы в отправку
+    попали и клиенты, добавленные после разбиения.
+    """
+    if mailing.shards.exclude(status='Готово').exists():
+        return list(mailing.shards.order_by('id'))
+    shard_size = shard_size or settings.MAILING_SHARD_SIZE
+    ids = mailing.recipients().order_by('id').values_list('id', flat=True).iterator()
+    # Каждый shard_size-й id, кроме первого, начинает следующий шард
+    bounds = list(islice(ids, shard_size, None, shard_size))
+    starts = [None] + bounds
+    ends = bounds + [None]
+    with transaction.atomic():
+        mailing.shards.all().delete()
+        return MailingShard.objects.bulk_create(
+            MailingShard(mailing=mailing, start_id=start, end_id=end)
+            for start, end in zip(starts, ends)
+        )
+
+
+def not_scheduled(queryset):
+    """Убирает из выборки строки рассылок, которые сейчас отправляет планировщик."""
+    return queryset.exclude(mailing__status='Запущена', mailing__claim_expires_at__gt=timezone.now())
+
+
+def lock_mailing(mailing_id):
+    """Блокирует рассылку до конца транзакции и отмечает её запущенной.
+
+    Возвращает ``False``, если рассылку держит планировщик: тогда её строки
+    очереди и шарды ждут, пока он закончит.
+    """
+    mailing = Mailing.objects.select_for_update().only(
+        'status', 'claim_expires_at', 'owner_id'
+    ).get(pk=mailing_id)
+    if mailing.status == 'Запущена' and mailing.claim_expires_at \
+            and mailing.claim_expires_at > timezone.now():
+        return False
+    if mailing.status == 'Создана':
+        mailing.status = 'Запущена'
+        mailing.save(update_fields=['status'])
+    return True
+
+
+def claim_shard(mailing=None, worker_id=WORKER_ID):
+    """Берёт в аренду ожидающий шард или шард с истёкшей арендой.
+
+    Так шарды упавшего обработчика подбирают остальные. Без ``mailing``
+    подходит шард любой рассылки. Шарды рассылки, которую захватил
+    планировщик, пропускаются.
+    """
+    shards = not_scheduled(MailingShard.objects.order_by('id'))
+    if mailing is not None:
+        shards = shards.filter(mailing=mailing)
+    with transaction.atomic():
+        shard = SHARD_LEASE.claim(shards, worker_id)
+        if shard is None or lock_mailing(shard.mailing_id):
+            return shard
+        transaction.set_rollback(True)
+    return None
+
+
+def renew_lease(shard):
+    """Продлевает аренду; ``False``, если шард уже забрал другой обработчик."""
+    return SHARD_LEASE.renew(shard)
+
+
+def release_shard(shard, finished):
+    """Отдаёт шард: завершённым или обратно в ожидание, если отправку прервали."""
+    if finished:
+        return SHARD_LEASE.release(shard, 'Готово', finished_at=timezone.now())
+    return SHARD_LEASE.release(shard, 'Ожидает', finished_at=None)
+
+
+def run_shard(shard, on_result=None, stop_event=None, **options):
+    """Отправляет рассылку клиентам шарда, удерживая аренду.
+
+    Возвращает ``True``, если шард отправлен целиком. Остальные параметры
+    передаются в ``send_mailing``.
+    """
+    stop_event = stop_event or threading.Event()
+    keeper = SHARD_LEASE.keeper(shard, stop_event)
+    finished = False
+    try:
+        with keeper:
+            send_mailing(shard.mailing, on_result=on_result, stop_event=stop_event,
+                         shard=shard, **options)
+        finished = not stop_event.is_set()
+    finally:
+        if not keeper.lost:
+            release_shard(shard, finished)
+    return finished
@@ -0,0 +1,54 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_owner_versions
+from .models import Attempt, Client, Mailing, Message, Segment
+from .stats import record_attempts
+
+
+@receiver(post_save, sender=Mailing)
+@receiver(post_delete, sender=Mailing)
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+@receiver(post_save, sender=Segment)
+@receiver(post_delete, sender=Segment)
+def owned_object_changed(sender, instance, **kwargs):
+    bump_owner_versions([instance.owner_id])
+
+
+@receiver(post_save, sender=Client)
+@receiver(pre_delete, sender=Client)
+def client_changed(sender, instance, **kwargs):
+    # Клиент виден владельцам всех рассылок, в которые он входит.
+    owner_ids = set(
+        Mailing.objects.filter(clients=instance).values_list('owner_id', flat=True)
+    )
+    bump_owner_versions(owner_ids | {instance.owner_id})
+
+
+@receiver(post_save, sender=Attempt)
+def attempt_saved(sender, instance, created, **kwargs):
+    # Пачки из AttemptWriter сюда не попадают: bulk_create не шлёт сигналов,
+    # и статистику с кешем он обновляет сам. Обработчика удаления нет, чтобы
+    # массовое удаление попыток (архивация, удаление рассылки) оставалось
+    # одним DELETE.
+    if created:
+        record_attempts([instance])
+    bump_owner_versions(
+        Mailing.objects.filter(pk=instance.mailing_id).values_list('owner_id', flat=True)
+    )
+
+
+@receiver(m2m_changed, sender=Mailing.clients.through)
+def mailing_clients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            bump_owner_versions([instance.owner_id])
+    elif action == 'pre_clear':
+        bump_owner_versions(
+            Mailing.objects.filter(clients=instance).values_list('owner_id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        bump_owner_versions(
+            Mailing.objects.filter(pk__in=pk_set).values_list('owner_id', flat=True)
+        )
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import bump_all_versions
+from .models import Attempt, DailyStat
+
+
+def record_attempts(attempts):
+    """Добавляет сохранённые попытки в дневную статистику.
+
+    Попытки группируются по рассылке и дню, так что на пачку уходит по одному
+    UPDATE на каждую пару (рассылка, день).
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for attempt in attempts:
+        key = (attempt.mailing.pk, attempt.mailing.owner_id, timezone.localdate(attempt.timestamp))
+        totals[key][0 if attempt.status == 'Успешно' else 1] += 1
+    for (mailing_id, owner_id, day), (success, fail) in totals.items():
+        _increment(mailing_id, owner_id, day, success, fail)
+
+
+def _increment(mailing_id, owner_id, day, success, fail):
+    def update():
+        return DailyStat.objects.filter(mailing_id=mailing_id, day=day).update(
+            success_count=F('success_count') + success,
+            fail_count=F('fail_count') + fail,
+        )
+
+    if update():
+        return
+    try:
+        with transaction.atomic():
+            DailyStat.objects.create(
+                mailing_id=mailing_id, owner_id=owner_id, day=day,
+                success_count=success, fail_count=fail,
+            )
+    except IntegrityError:
+        update()
+
+
+def rebuild_daily_stats(since=None, before=None, chunk_size=1000):
+    """Пересчитывает дневную статистику по таблице попыток.
+
+    Пересчитываются только дни, за которые в таблице есть попытки (с
+    ``since`` включительно и до ``before``), остальные строки статистики — в
+    том числе по уже заархивированным дням — не трогаются. День, который
+    заархивирован не целиком, пересчитается по оставшимся попыткам.
+    """
+    attempts = Attempt.objects.annotate(day=TruncDate('timestamp'))
+    if since:
+        attempts = attempts.filter(day__gte=since)
+    if before:
+        attempts = attempts.filter(day__lt=before)
+    rows = (
+        attempts.values('mailing_id', 'mailing__owner_id', 'day')
+        .annotate(
+            success=Count('pk', filter=Q(status='Успешно')),
+            fail=Count('pk', filter=Q(status='Не успешно')),
+        )
+        .order_by()
+    )
+    days = attempts.values('day').distinct().order_by()
+    with transaction.atomic():
+        DailyStat.objects.filter(day__in=days).delete()
+        buffer = []
+        created = 0
+        for row in rows.iterator(chunk_size=chunk_size):
+            buffer.append(DailyStat(
+                mailing_id=row['mailing_id'], owner_id=row['mailing__owner_id'], day=row['day'],
+                success_count=row['success'], fail_count=row['fail'],
+            ))
+            if len(buffer) >= chunk_size:
+                DailyStat.objects.bulk_create(buffer)
+                created += len(buffer)
+                buffer = []
+        DailyStat.objects.bulk_create(buffer)
+        created += len(buffer)
+    bump_all_versions()
+    return created
+
+
+def owner_totals(owner):
+    totals = DailyStat.objects.filter(owner=owner).aggregate(
+        success=Sum('success_count', default=0),
+        fail=Sum('fail_count', default=0),
+    )
+    totals['total'] = totals['success'] + totals['fail']
+    return totals
+
+
+def owner_daily_series(owner, days=30):
+    since = timezone.localdate() - timedelta(days=days - 1)
+    return list(
+        DailyStat.objects.filter(owner=owner, day__gte=since)
+        .values('day')
+        .annotate(success=Sum('success_count'), fail=Sum('fail_count'))
+        .order_by('day')
+    )
@@ -0,0 +1,44 @@
+import hashlib
+from array import array
+from bisect import bisect_left
+
+from .models import Suppression
+
+
+def _digest(email):
+    normalized = email.strip().lower().encode()
+    return int.from_bytes(hashlib.blake2b(normalized, digest_size=8).digest(), 'big')
+
+
+class SuppressionIndex:
+    """Список подавления в памяти для проверки адресов в цикле отправки.
+
+    Хранятся не сами адреса, а их 64-битные хеши в отсортированном массиве:
+    8 байт на адрес против сотни с лишним у множества строк, а проверка —
+    двоичный поиск. Вероятность ложного совпадения на миллионах адресов
+    пренебрежимо мала.
+    """
+
+    def __init__(self, digests=()):
+        self.digests = array('Q', sorted(set(digests)))
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        emails = Suppression.objects.values_list('email', flat=True).iterator(chunk_size=chunk_size)
+        return cls(_digest(email) for email in emails)
+
+    def __contains__(self, email):
+        digest = _digest(email)
+        i = bisect_left(self.digests, digest)
+        return i < len(self.digests) and self.digests[i] == digest
+
+    def __len__(self):
+        return len(self.digests)
+
+
+def suppress(email, reason='Отписка', comment=''):
+    """Добавляет адрес в список подавления, если его там ещё нет."""
+    suppression, _ = Suppression.objects.get_or_create(
+        email=email.strip().lower(), defaults={'reason': reason, 'comment': comment}
+    )
+    return suppression
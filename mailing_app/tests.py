@@ -1,3 +1,997 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import smtplib
+import tempfile
+import threading
+from email import message_from_bytes
+from datetime import timedelta
 
-# Create your tests here.
+from unittest import mock, skipUnless
+
+from django.core import mail
+from django.core.exceptions import BadRequest
+from django.core.mail import EmailMessage
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Count, QuerySet
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.personalization import substitute
+from benchmarks.smtp_sink import SMTPSink
+from users.models import CustomUser
+from .archive import archive_attempts
+from .asyncsmtp import EmailBackend as AsyncSMTPBackend, SMTPConnection
+from .forms import MailingForm
+from .imports import import_clients
+from .jobs import claim_due_retries, claim_next_job, enqueue_mailing, run_job
+from .leases import LeaseKeeper
+from .models import (
+    Attempt, Client, DailyStat, Mailing, MailingShard, Message, RetryEntry, Segment, SendJob,
+    Suppression,
+)
+from .pagination import encode_cursor, keyset_paginate
+from .personalization import compile_template
+from .ratelimit import LocalBuckets, RateLimiter, RedisBuckets
+from .scheduler import claim_due_mailing, finish_expired_mailings, renew_claim, run_due_mailing
+from .services import (
+    AttemptWriter, Dispatch, MailSender, PreparedMessage, is_bounce, is_temporary_error,
+    pending_recipients, retry_delay,
+)
+from .shards import claim_shard, create_shards, release_shard, renew_lease, run_shard
+from .stats import owner_daily_series, owner_totals, record_attempts
+from .suppression import SuppressionIndex
+from .views import AttemptListView
+
+
+def seed_mailings(count, clients_per_mailing=2):
+    """Создаёт ``count`` рассылок с клиентами и попытками, каждую у своего владельца."""
+    now = timezone.now()
+    start = Mailing.objects.count()
+    for i in range(start, start + count):
+        owner = CustomUser.objects.create(email=f'owner{i}@example.com', username=f'owner{i}')
+        message = Message.objects.create(subject=f'Тема {i}', body='Текст', owner=owner)
+        mailing = Mailing.objects.create(
+            owner=owner, start_time=now, end_time=now + timedelta(days=1), message=message
+        )
+        clients = [
+            Client.objects.create(email=f'client{i}-{j}@example.com', full_name=f'Клиент {j}', owner=owner)
+            for j in range(clients_per_mailing)
+        ]
+        mailing.clients.set(clients)
+        Attempt.objects.create(mailing=mailing, client=clients[0], status='Успешно', server_response='ok')
+        Attempt.objects.create(mailing=mailing, client=clients[1], status='Успешно', server_response='ok')
+        Attempt.objects.create(mailing=mailing, status='Не успешно', server_response='error')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class QueryBudgetTestCase(TestCase):
+    """Проверяет, что число запросов страницы не растёт вместе с данными."""
+
+    def setUp(self):
+        self.manager = CustomUser.objects.create(
+            email='manager@example.com', username='manager', role='manager'
+        )
+        self.client.force_login(self.manager)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response
+
+    def assertQueriesDoNotScale(self, url, seed, small=1, large=10):
+        seed(small)
+        baseline, _ = self.count_queries(url)
+        seed(large - small)
+        queries, response = self.count_queries(url)
+        self.assertEqual(
+            queries, baseline,
+            f'{url}: {baseline} запросов на {small} строк и {queries} на {large}',
+        )
+        return response
+
+
+class MailingReportViewTest(QueryBudgetTestCase):
+    def test_report_counts(self):
+        seed_mailings(2)
+        _, response = self.count_queries(reverse('mailing_report'))
+        report = response.context['report']
+        self.assertEqual(len(report), 2)
+        for item in report:
+            self.assertEqual((item['total'], item['success'], item['fail']), (3, 2, 1))
+
+    def test_query_count_does_not_grow_with_mailings(self):
+        response = self.assertQueriesDoNotScale(reverse('mailing_report'), seed_mailings)
+        self.assertEqual(len(response.context['report']), 10)
+
+
+class ListQueryBudgetTest(QueryBudgetTestCase):
+    def test_mailing_list(self):
+        self.assertQueriesDoNotScale(reverse('mailing_list'), seed_mailings)
+
+    def test_attempt_list(self):
+        self.assertQueriesDoNotScale(reverse('attempt_list'), seed_mailings)
+
+    def test_client_list(self):
+        self.assertQueriesDoNotScale(reverse('client_list'), seed_mailings)
+
+    def test_message_list(self):
+        self.assertQueriesDoNotScale(reverse('message_list'), seed_mailings)
+
+    def test_user_list(self):
+        self.assertQueriesDoNotScale(reverse('user_list'), seed_mailings)
+
+
+class KeysetPaginationTest(TestCase):
+    ordering = AttemptListView.keyset_ordering
+
+    def setUp(self):
+        seed_mailings(3)
+        # Несколько попыток с одинаковым временем: порядок между ними задаёт id
+        now = timezone.now()
+        attempts = list(Attempt.objects.order_by('id'))
+        for i, attempt in enumerate(attempts):
+            attempt.timestamp = now - timedelta(minutes=i // 4)
+        Attempt.objects.bulk_update(attempts, ['timestamp'])
+        self.expected = list(
+            Attempt.objects.order_by('-timestamp', '-id').values_list('id', flat=True)
+        )
+
+    def paginate(self, cursor=None, before=None):
+        return keyset_paginate(Attempt.objects.all(), self.ordering, cursor, 2, before=before)
+
+    def ids(self, page):
+        return [attempt.pk for attempt in page]
+
+    def test_next_and_previous_cursors_walk_every_row_once(self):
+        pages = [self.paginate()]
+        self.assertFalse(pages[0].has_previous)
+        while pages[-1].has_next:
+            pages.append(self.paginate(pages[-1].next_cursor))
+        self.assertEqual([pk for page in pages for pk in self.ids(page)], self.expected)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 2, 1])
+
+        for index in range(len(pages) - 1, 0, -1):
+            previous = self.paginate(before=pages[index].previous_cursor)
+            self.assertEqual(self.ids(previous), self.ids(pages[index - 1]))
+            self.assertEqual(previous.has_previous, index > 1)
+            self.assertEqual(previous.next_cursor, pages[index - 1].next_cursor)
+
+    def cursor(self, pk):
+        return encode_cursor([Attempt.objects.get(pk=pk).timestamp, pk])
+
+    def test_last_page(self):
+        page = self.paginate(self.cursor(self.expected[-2]))
+        self.assertEqual(self.ids(page), self.expected[-1:])
+        self.assertFalse(page.has_next)
+        self.assertTrue(page.has_previous)
+        page = self.paginate(self.cursor(self.expected[-1]))
+        self.assertEqual(self.ids(page), [])
+        self.assertFalse(page.has_next)
+
+    def test_invalid_cursor_is_bad_request(self):
+        for cursor in ('не курсор', encode_cursor(['2026-01-01T00:00:00']),
+                       encode_cursor(['вчера', 1]), encode_cursor({'id': 1}), 'e30'):
+            with self.subTest(cursor=cursor):
+                with self.assertRaises(BadRequest):
+                    self.paginate(cursor)
+                with self.assertRaises(BadRequest):
+                    self.paginate(before=cursor)
+        user = CustomUser.objects.create(email='manager@example.com', username='manager', role='manager')
+        self.client.force_login(user)
+        response = self.client.get(reverse('attempt_list'), {'after': 'не курсор'})
+        self.assertEqual(response.status_code, 400)
+
+class ExportViewTest(TestCase):
+    def setUp(self):
+        seed_mailings(2)
+        self.mailing = Mailing.objects.get(owner__username='owner0')
+        self.client.force_login(self.mailing.owner)
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_attempt_csv_has_header_and_only_own_rows(self):
+        response, body = self.export('attempt_export', format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="attempts.csv"')
+        self.assertTrue(body.startswith('\ufeff'))
+        header, *rows = csv.reader(io.StringIO(body.lstrip('\ufeff')))
+        self.assertEqual(header, ['id', 'mailing_id', 'mailing__message__subject', 'client__email',
+                                  'status', 'timestamp', 'server_response'])
+        expected = Attempt.objects.filter(mailing=self.mailing).order_by('id')
+        self.assertEqual([row[0] for row in rows], [str(pk) for pk in expected.values_list('id', flat=True)])
+        self.assertEqual({row[1] for row in rows}, {str(self.mailing.pk)})
+        self.assertEqual(rows[0][2:5], ['Тема 0', 'client0-0@example.com', 'Успешно'])
+
+        _, body = self.export('attempt_export', format='csv', status='Не успешно')
+        self.assertEqual(len(body.splitlines()), 2)
+
+    def test_manager_exports_all_attempts(self):
+        manager = CustomUser.objects.create(email='manager@example.com', username='manager', role='manager')
+        self.client.force_login(manager)
+        _, body = self.export('attempt_export', format='unknown')
+        self.assertEqual(len(body.splitlines()), Attempt.objects.count() + 1)
+
+    def test_report_jsonl(self):
+        response, body = self.export('mailing_report_export', format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], self.mailing.pk)
+        self.assertEqual((rows[0]['total'], rows[0]['success'], rows[0]['fail']), (3, 2, 1))
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN-проверки написаны для PostgreSQL')
+class QueryPlanTest(TestCase):
+    OWNERS = 50
+    MAILINGS_PER_OWNER = 2
+    ATTEMPTS_PER_MAILING = 200
+    # Дневная статистика за год: при сотне строк планировщику выгоднее Seq Scan
+    ROLLUP_DAYS = 365
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        owners = CustomUser.objects.bulk_create(
+            CustomUser(email=f'owner{i}@example.com', username=f'owner{i}')
+            for i in range(cls.OWNERS)
+        )
+        messages = Message.objects.bulk_create(
+            Message(subject=f'Тема {i}', body='Текст', owner=owner)
+            for i, owner in enumerate(owners)
+        )
+        mailings = Mailing.objects.bulk_create(
+            Mailing(owner=message.owner, message=message, start_time=now,
+                    end_time=now + timedelta(days=1))
+            for message in messages
+            for _ in range(cls.MAILINGS_PER_OWNER)
+        )
+        Attempt.objects.bulk_create(
+            Attempt(mailing=mailing, status='Успешно' if i % 4 else 'Не успешно',
+                    server_response='ok')
+            for mailing in mailings
+            for i in range(cls.ATTEMPTS_PER_MAILING)
+        )
+        today = timezone.localdate()
+        DailyStat.objects.bulk_create(
+            DailyStat(mailing=mailing, owner_id=mailing.owner_id, day=today - timedelta(days=day),
+                      success_count=150, fail_count=50)
+            for mailing in mailings
+            for day in range(cls.ROLLUP_DAYS)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.owner = owners[0]
+        cls.mailing = mailings[0]
+
+    def view_queryset(self, view_class, **params):
+        request = RequestFactory().get('/', params)
+        request.user = self.owner
+        view = view_class()
+        view.setup(request)
+        return view.get_queryset()
+
+    def assertUsesIndex(self, queryset, table):
+        self.assertPlanUsesIndex(queryset.explain(), table)
+
+    def assertPlanUsesIndex(self, plan, table):
+        self.assertIn('Index', plan, plan)
+        self.assertNotIn(f'Seq Scan on {table}', plan, plan)
+
+    def assertQueriesUseIndex(self, func, table):
+        """Выполняет ``func`` и проверяет план каждого её запроса к ``table``."""
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+        queries = [query['sql'] for query in ctx.captured_queries if table in query['sql']]
+        self.assertTrue(queries, f'{func.__name__} не читает {table}')
+        for sql in queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            self.assertPlanUsesIndex(plan, table)
+
+    def test_home_reads_rollup_by_index(self):
+        self.assertQueriesUseIndex(lambda: owner_totals(self.owner), 'mailing_app_dailystat')
+        self.assertQueriesUseIndex(lambda: owner_daily_series(self.owner), 'mailing_app_dailystat')
+
+    def test_report_reads_rollup_by_index(self):
+        self.client.force_login(self.owner)
+
+        def report_page():
+            self.assertEqual(self.client.get(reverse('mailing_report')).status_code, 200)
+
+        self.assertQueriesUseIndex(report_page, 'mailing_app_dailystat')
+
+    def test_attempt_list_page_uses_index(self):
+        queryset = self.view_queryset(AttemptListView, mailing=self.mailing.pk, status='Успешно')
+        self.assertUsesIndex(
+            queryset.order_by(*AttemptListView.keyset_ordering)[:AttemptListView.paginate_by + 1],
+            'mailing_app_attempt',
+        )
+
+
+class ArchiveResumeTest(TestCase):
+    def test_archived_deliveries_are_not_sent_again(self):
+        seed_mailings(1, clients_per_mailing=20)
+        mailing = Mailing.objects.get()
+        Attempt.objects.filter(status='Успешно').delete()
+        Attempt.objects.bulk_create(
+            Attempt(mailing=mailing, client=client, status='Успешно', server_response='ok')
+            for client in mailing.clients.all()
+        )
+        Attempt.objects.update(timestamp=timezone.now() - timedelta(days=30))
+        self.assertEqual(pending_recipients(mailing).count(), 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            _, archived = archive_attempts(7, directory=directory)
+
+        self.assertEqual(archived, 21)
+        self.assertFalse(Attempt.objects.exists())
+        self.assertEqual(pending_recipients(mailing).count(), 0)
+
+    def test_interrupted_archive_keeps_daily_stats(self):
+        seed_mailings(2, clients_per_mailing=4)
+        for days, attempts in ((30, Attempt.objects.filter(mailing__owner__username='owner0')),
+                               (31, Attempt.objects.filter(mailing__owner__username='owner1'))):
+            attempts.update(timestamp=timezone.now() - timedelta(days=days))
+        # Попытки попали в статистику за сегодня; переносим их в их дни
+        DailyStat.objects.all().delete()
+        record_attempts(Attempt.objects.select_related('mailing'))
+        stats = list(DailyStat.objects.values_list('mailing_id', 'day', 'success_count', 'fail_count'))
+
+        delete = QuerySet.delete
+        calls = []
+
+        def delete_once(queryset):
+            calls.append(queryset)
+            if len(calls) > 1:
+                raise OperationalError('connection lost')
+            return delete(queryset)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(QuerySet, 'delete', delete_once):
+                with self.assertRaises(OperationalError):
+                    archive_attempts(7, directory=directory, chunk_size=2)
+            self.assertEqual(Attempt.objects.count(), 4)
+            _, archived = archive_attempts(7, directory=directory, chunk_size=2)
+
+        self.assertEqual(archived, 4)
+        self.assertCountEqual(
+            DailyStat.objects.values_list('mailing_id', 'day', 'success_count', 'fail_count'), stats
+        )
+
+
+class MultiWorkerSendTest(TransactionTestCase):
+    # Потоки отправки ходят в базу своими соединениями, поэтому данные
+    # теста должны быть закоммичены
+    def test_each_recipient_gets_one_attempt(self):
+        seed_mailings(1, clients_per_mailing=30)
+        mailing = Mailing.objects.get()
+        Attempt.objects.all().delete()
+
+        call_command('send_mailing', mailing.pk, '--workers', '4', stdout=io.StringIO())
+
+        client_ids = set(mailing.clients.values_list('id', flat=True))
+        per_client = dict(Attempt.objects.values_list('client').annotate(count=Count('id')))
+        self.assertEqual(set(per_client), client_ids)
+        self.assertEqual(set(per_client.values()), {1})
+        sent = [email for message in mail.outbox for email in message.to]
+        self.assertEqual(len(sent), 30)
+        self.assertEqual(len(set(sent)), 30)
+
+class SendJobTest(TestCase):
+    def setUp(self):
+        seed_mailings(1)
+        self.mailing = Mailing.objects.get()
+
+    def test_enqueue_twice_creates_one_job(self):
+        job = enqueue_mailing(self.mailing)
+        self.assertEqual(enqueue_mailing(self.mailing), job)
+        self.assertEqual(SendJob.objects.count(), 1)
+        with self.assertRaises(IntegrityError):
+            SendJob.objects.create(mailing=self.mailing, status='Выполняется')
+
+    def test_expired_job_is_reclaimed(self):
+        enqueue_mailing(self.mailing)
+        job = claim_next_job(worker_id='dead')
+        self.assertIsNone(claim_next_job(worker_id='alive'))
+        SendJob.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        reclaimed = claim_next_job(worker_id='alive')
+        self.assertEqual(reclaimed, job)
+        self.assertEqual(reclaimed.lease_owner, 'alive')
+        self.assertEqual(enqueue_mailing(self.mailing), job)
+
+    def test_interrupted_job_returns_to_queue(self):
+        enqueue_mailing(self.mailing)
+        job = claim_next_job()
+        with mock.patch('mailing_app.jobs.run_shard', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                run_job(job)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'В очереди')
+        self.assertEqual(job.lease_owner, '')
+        self.assertEqual(claim_next_job(), job)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MailingListCacheTest(TestCase):
+    def setUp(self):
+        seed_mailings(2)
+        self.mailing = Mailing.objects.first()
+        self.client.force_login(self.mailing.owner)
+
+    def mailing_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('mailing_list'))
+        self.assertEqual(response.status_code, 200)
+        return [q['sql'] for q in ctx if 'mailing_app_mailing' in q['sql']], response
+
+    def test_cached_page_skips_queries_until_data_changes(self):
+        queries, _ = self.mailing_queries()
+        self.assertTrue(queries)
+        queries, response = self.mailing_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, self.mailing.message.subject)
+
+        self.mailing.message.subject = 'Новая тема'
+        self.mailing.message.save()
+        queries, response = self.mailing_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, 'Новая тема')
+
+
+class SchedulerClaimTest(TestCase):
+    def setUp(self):
+        seed_mailings(1)
+        self.mailing = Mailing.objects.get()
+        Mailing.objects.update(start_time=timezone.now() - timedelta(minutes=1))
+
+    def test_expired_claim_is_taken_over(self):
+        claimed = claim_due_mailing(worker_id='crashed')
+        self.assertEqual(claimed.status, 'Запущена')
+        self.assertIsNone(claim_due_mailing(worker_id='alive'))
+
+        Mailing.objects.update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(finish_expired_mailings(), 0)
+        taken = claim_due_mailing(worker_id='alive')
+        self.assertEqual(taken, self.mailing)
+        self.assertEqual(taken.claim_owner, 'alive')
+        self.assertFalse(renew_claim(claimed))
+        self.assertTrue(renew_claim(taken))
+
+    def test_claimed_mailing_is_not_finished_by_others(self):
+        claim_due_mailing()
+        Mailing.objects.update(end_time=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(finish_expired_mailings(), 0)
+        Mailing.objects.update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(finish_expired_mailings(), 1)
+
+    def test_mailing_sent_by_worker_is_not_claimed(self):
+        enqueue_mailing(self.mailing)
+        self.assertIsNone(claim_due_mailing())
+        job = claim_next_job()
+        self.assertEqual(Mailing.objects.get().status, 'Запущена')
+        self.assertIsNone(claim_due_mailing())
+
+        create_shards(self.mailing)
+        SendJob.objects.update(status='Выполнено')
+        self.assertIsNone(claim_due_mailing())
+        MailingShard.objects.update(status='Готово')
+        self.assertEqual(claim_due_mailing(), job.mailing)
+
+    def test_worker_skips_mailing_claimed_by_scheduler(self):
+        claim_due_mailing(worker_id='scheduler')
+        job = enqueue_mailing(self.mailing)
+        self.assertIsNone(claim_next_job())
+        create_shards(self.mailing)
+        self.assertIsNone(claim_shard())
+
+        Mailing.objects.update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_next_job(), job)
+        self.assertIsNotNone(claim_shard())
+
+    def test_interrupted_run_releases_claim(self):
+        mailing = claim_due_mailing()
+        with mock.patch('mailing_app.scheduler.send_mailing', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                run_due_mailing(mailing)
+        mailing.refresh_from_db()
+        self.assertEqual((mailing.status, mailing.claim_owner), ('Создана', ''))
+
+
+class RetryTest(TestCase):
+    def setUp(self):
+        seed_mailings(1, clients_per_mailing=4)
+        self.mailing = Mailing.objects.get()
+        Attempt.objects.all().delete()
+        self.clients = list(self.mailing.clients.order_by('id'))
+
+    def refused(self, code):
+        return smtplib.SMTPRecipientsRefused({'a@example.com': (code, b'no')})
+
+    def test_error_classification(self):
+        self.assertTrue(is_temporary_error(self.refused(451)))
+        self.assertFalse(is_temporary_error(self.refused(550)))
+        self.assertTrue(is_temporary_error(smtplib.SMTPDataError(421, b'busy')))
+        self.assertFalse(is_temporary_error(smtplib.SMTPDataError(554, b'spam')))
+        self.assertTrue(is_temporary_error(smtplib.SMTPServerDisconnected()))
+        self.assertTrue(is_temporary_error(ConnectionRefusedError()))
+        self.assertFalse(is_temporary_error(smtplib.SMTPAuthenticationError(535, b'auth')))
+        self.assertTrue(is_bounce(self.refused(550)))
+        self.assertFalse(is_bounce(self.refused(451)))
+        self.assertFalse(is_bounce(smtplib.SMTPDataError(550, b'no')))
+
+    @override_settings(MAILING_RETRY_BASE_DELAY=60, MAILING_RETRY_MAX_DELAY=300)
+    def test_retry_delay_doubles_up_to_max(self):
+        delays = [retry_delay(n).total_seconds() for n in range(1, 6)]
+        self.assertEqual(delays, [60, 120, 240, 300, 300])
+
+    def retry(self, errors, retry_count=1):
+        entries = [
+            RetryEntry.objects.create(
+                mailing=self.mailing, client=client, retry_count=retry_count,
+                next_attempt_at=timezone.now(), last_error='451',
+            )
+            for client in self.clients
+        ]
+        entries = list(RetryEntry.objects.select_related('mailing__message', 'client').order_by('client_id'))
+        with mock.patch.object(Dispatch, 'send_one', side_effect=errors):
+            with AttemptWriter() as writer:
+                return Dispatch(self.mailing, writer, suppressed=set()).retry(entries)
+
+    @override_settings(MAILING_RETRY_MAX_ATTEMPTS=3)
+    def test_retry_outcomes(self):
+        finished, rescheduled = self.retry(
+            [None, self.refused(451), self.refused(550), smtplib.SMTPServerDisconnected()]
+        )
+        self.assertEqual([e.client for e in finished], [self.clients[0], self.clients[2]])
+        self.assertEqual([e.client for e in rescheduled], [self.clients[1], self.clients[3]])
+        self.assertTrue(all(e.retry_count == 2 and e.next_attempt_at > timezone.now() for e in rescheduled))
+        statuses = dict(Attempt.objects.values_list('client', 'status'))
+        self.assertEqual(statuses, {self.clients[0].pk: 'Успешно', self.clients[2].pk: 'Не успешно'})
+        self.assertTrue(Suppression.objects.filter(email=self.clients[2].email).exists())
+
+    @override_settings(MAILING_RETRY_MAX_ATTEMPTS=3)
+    def test_last_retry_records_failure(self):
+        finished, rescheduled = self.retry([self.refused(451)] * 4, retry_count=3)
+        self.assertEqual((len(finished), rescheduled), (4, []))
+        self.assertEqual(Attempt.objects.filter(status='Не успешно').count(), 4)
+
+    def test_retry_after_mailing_end_records_failure(self):
+        Mailing.objects.update(end_time=timezone.now() - timedelta(minutes=1))
+        self.mailing.refresh_from_db()
+        finished, rescheduled = self.retry([])
+        self.assertEqual((len(finished), rescheduled), (4, []))
+        self.assertEqual(Attempt.objects.filter(status='Не успешно').count(), 4)
+
+    def test_permanent_failures_are_not_resent(self):
+        Attempt.objects.create(mailing=self.mailing, client=self.clients[0], status='Успешно')
+        Attempt.objects.create(mailing=self.mailing, client=self.clients[1], status='Не успешно')
+        RetryEntry.objects.create(mailing=self.mailing, client=self.clients[2],
+                                  next_attempt_at=timezone.now())
+        self.assertEqual(list(pending_recipients(self.mailing)), [self.clients[3]])
+
+    @skipUnless(connection.features.has_select_for_update_of, 'нет SELECT ... FOR UPDATE OF')
+    def test_claim_locks_only_retry_rows(self):
+        RetryEntry.objects.create(mailing=self.mailing, client=self.clients[0],
+                                  next_attempt_at=timezone.now())
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(len(claim_due_retries()), 1)
+        locking = [query['sql'] for query in ctx.captured_queries if 'FOR UPDATE' in query['sql']]
+        self.assertEqual(len(locking), 1)
+        self.assertIn('FOR UPDATE OF "mailing_app_retryentry" SKIP LOCKED', locking[0])
+
+    @override_settings(MAILING_RETRY_BASE_DELAY=0)
+    def test_send_mailing_can_wait_for_retries(self):
+        errors = [self.refused(451), None, None, None, None]
+        with mock.patch.object(Dispatch, 'send_one', side_effect=errors):
+            call_command('send_mailing', self.mailing.pk, '--wait-retries', stdout=io.StringIO())
+        self.assertFalse(RetryEntry.objects.exists())
+        self.assertEqual(Attempt.objects.filter(status='Успешно').count(), 4)
+
+
+class ShardTest(TestCase):
+    def setUp(self):
+        seed_mailings(1, clients_per_mailing=7)
+        self.mailing = Mailing.objects.get()
+
+    def test_create_shards_covers_every_client_once(self):
+        shards = create_shards(self.mailing, shard_size=3)
+        self.assertEqual([len(shard.clients_in(self.mailing.clients.all())) for shard in shards], [3, 3, 1])
+        self.assertIsNone(shards[0].start_id)
+        self.assertIsNone(shards[-1].end_id)
+        self.assertEqual(shards[0].end_id, shards[1].start_id)
+        # Пока шарды не доработаны, повторный вызов их не пересоздаёт
+        self.assertEqual(create_shards(self.mailing, shard_size=2), shards)
+
+    def test_expired_lease_is_taken_over(self):
+        create_shards(self.mailing, shard_size=10)
+        lost = claim_shard(worker_id='crashed')
+        self.assertIsNone(claim_shard(worker_id='alive'))
+        MailingShard.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        taken = claim_shard(self.mailing, worker_id='alive')
+        self.assertEqual(taken, lost)
+        self.assertFalse(renew_lease(lost))
+        self.assertFalse(release_shard(lost, finished=True))
+        self.assertTrue(renew_lease(taken))
+        self.assertTrue(release_shard(taken, finished=True))
+        self.assertEqual(MailingShard.objects.get().status, 'Готово')
+
+    def test_interrupted_shard_is_released(self):
+        create_shards(self.mailing, shard_size=10)
+        shard = claim_shard()
+        with mock.patch('mailing_app.shards.send_mailing', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                run_shard(shard)
+        shard.refresh_from_db()
+        self.assertEqual((shard.status, shard.lease_owner, shard.lease_expires_at), ('Ожидает', '', None))
+        self.assertEqual(claim_shard(), shard)
+
+
+class RateLimiterTest(TestCase):
+    def test_local_bucket_refills_and_denies(self):
+        buckets = LocalBuckets()
+        # 1 жетон в секунду, ёмкость 2
+        bucket = {'key': (1 / 1000, 2, 1)}
+        with mock.patch('mailing_app.ratelimit.time.monotonic', return_value=100.0):
+            self.assertEqual(buckets.take(bucket), 0)
+            self.assertEqual(buckets.take(bucket), 0)
+            self.assertEqual(buckets.take(bucket), 1000)
+        with mock.patch('mailing_app.ratelimit.time.monotonic', return_value=100.5):
+            self.assertEqual(buckets.take(bucket), 500)
+        with mock.patch('mailing_app.ratelimit.time.monotonic', return_value=110.0):
+            # Корзина не наполняется сверх ёмкости
+            self.assertEqual(buckets.take({'key': (1 / 1000, 2, 2)}), 0)
+            self.assertEqual(buckets.take(bucket), 1000)
+
+    def test_denied_batch_takes_nothing_from_any_bucket(self):
+        buckets = LocalBuckets()
+        with mock.patch('mailing_app.ratelimit.time.monotonic', return_value=100.0):
+            self.assertGreater(buckets.take({'a': (1 / 1000, 5, 1), 'b': (1 / 1000, 1, 2)}), 0)
+            self.assertEqual(buckets.take({'a': (1 / 1000, 5, 5)}), 0)
+
+    @override_settings(EMAIL_HOST_USER='sender@example.com', MAILING_RATE_LIMIT_BURST=10)
+    def test_buckets_group_by_domain(self):
+        limiter = RateLimiter(account_limit=600, domain_limit=60, domain_limits={'mail.ru': 120})
+        buckets = limiter.buckets(['a@gmail.com', 'b@Gmail.com', 'c@mail.ru', 'd@example.com'])
+        self.assertEqual(buckets, {
+            'ratelimit:account:sender@example.com': (600 / 60000, 100, 4),
+            'ratelimit:domain:gmail.com': (60 / 60000, 10, 2),
+            'ratelimit:domain:mail.ru': (120 / 60000, 20, 1),
+            'ratelimit:domain:example.com': (60 / 60000, 10, 1),
+        })
+        limiter = RateLimiter(domain_limits={'mail.ru': 120})
+        self.assertEqual(list(limiter.buckets(['a@gmail.com', 'c@mail.ru'])), ['ratelimit:domain:mail.ru'])
+
+    @override_settings(MAILING_RATE_LIMIT_BURST=10, MAILING_RATE_LIMIT_BATCH=20)
+    def test_batch_size_is_capped_by_smallest_bucket(self):
+        self.assertEqual(RateLimiter(account_limit=6000).batch_size, 20)
+        self.assertEqual(RateLimiter(account_limit=6000, domain_limit=60).batch_size, 10)
+        self.assertEqual(RateLimiter(domain_limit=1).batch_size, 1)
+
+    @override_settings(MAILING_RATE_LIMIT_REDIS_URL='redis://127.0.0.1:1/0', MAILING_RATE_LIMIT_BURST=10)
+    def test_unreachable_redis_falls_back_to_local_buckets(self):
+        limiter = RateLimiter(account_limit=60)
+        self.assertIsInstance(limiter.backend, RedisBuckets)
+        self.assertEqual(limiter.reserve(['a@example.com']), 0)
+        self.assertEqual(limiter.local.levels['ratelimit:account:' + limiter.account][0], 9)
+
+    async def test_async_acquire_reserves_off_the_event_loop(self):
+        limiter = RateLimiter(account_limit=60)
+        loop_thread = threading.get_ident()
+        threads = []
+
+        def reserve(emails):
+            threads.append(threading.get_ident())
+            return 0
+
+        with mock.patch.object(limiter, 'reserve', side_effect=reserve):
+            self.assertTrue(await limiter.aacquire(['a@example.com'], lambda: False))
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+
+class AsyncSMTPTest(SimpleTestCase):
+    REPLIES = {
+        'deferred@example.com': '451 4.7.1 Try again later',
+        'rejected@example.com': '550 5.1.1 No such user',
+    }
+    DATA = b'Subject: test\r\n\r\nbody\r\n'
+
+    def connection(self, sink):
+        backend = AsyncSMTPBackend(host=sink.host, port=sink.port, username='', password='',
+                                   use_tls=False, use_ssl=False, timeout=5, batch_size=100)
+        return SMTPConnection(backend)
+
+    def sink(self, **options):
+        sink = SMTPSink(rcpt_replies=self.REPLIES, record=True, **options).start()
+        self.addCleanup(sink.stop)
+        return sink
+
+    async def test_rcpt_replies(self):
+        for pipelining in (True, False):
+            with self.subTest(pipelining=pipelining):
+                sink = self.sink(pipelining=pipelining)
+                connection = self.connection(sink)
+                refused = await connection.deliver('from@example.com', [
+                    'ok@example.com', 'deferred@example.com', 'rejected@example.com',
+                ], self.DATA)
+                self.assertEqual({address: code for address, (code, _) in refused.items()}, {
+                    'deferred@example.com': 451, 'rejected@example.com': 550,
+                })
+                self.assertEqual(sink.received, 1)
+                self.assertEqual('pipelining' in connection.features, pipelining)
+                await connection.close()
+
+    async def test_all_refused_resets_and_keeps_connection(self):
+        for pipelining, lenient_data in ((True, False), (True, True), (False, False)):
+            with self.subTest(pipelining=pipelining, lenient_data=lenient_data):
+                sink = self.sink(pipelining=pipelining, lenient_data=lenient_data)
+                connection = self.connection(sink)
+                with self.assertRaises(smtplib.SMTPRecipientsRefused) as ctx:
+                    await connection.deliver('from@example.com', ['rejected@example.com'], self.DATA)
+                self.assertEqual(ctx.exception.recipients['rejected@example.com'][0], 550)
+                self.assertEqual(sink.commands[-1], 'RSET')
+                # Ответы не сбились: следующее письмо уходит по тому же соединению
+                await connection.deliver('from@example.com', ['ok@example.com'], self.DATA)
+                self.assertEqual(sink.received, 1)
+                self.assertEqual(sink.commands.count('EHLO'), 1)
+                await connection.close()
+
+    async def test_reconnects_after_disconnect(self):
+        for pipelining in (True, False):
+            with self.subTest(pipelining=pipelining):
+                sink = self.sink(pipelining=pipelining)
+                connection = self.connection(sink)
+                await connection.deliver('from@example.com', ['ok@example.com'], self.DATA)
+                sink.disconnect()
+                await connection.deliver('from@example.com', ['ok@example.com'], self.DATA)
+                self.assertEqual(sink.received, 2)
+                self.assertEqual(sink.commands.count('EHLO'), 2)
+                await connection.close()
+
+
+class MailSenderTest(SimpleTestCase):
+    def sender(self, sink):
+        backend = SMTPBackend(host=sink.host, port=sink.port, username='', password='',
+                              use_tls=False, use_ssl=False, timeout=5)
+        return MailSender(backend)
+
+    def sink(self):
+        sink = SMTPSink(record=True).start()
+        self.addCleanup(sink.stop)
+        return sink
+
+    def send(self, sender, raw):
+        if raw:
+            sender.send_prepared(PreparedMessage('Тема', 'Текст'), 'ok@example.com')
+        else:
+            sender.send(EmailMessage('Тема', 'Текст', 'from@example.com', ['ok@example.com']))
+
+    def test_reconnects_when_connection_drops(self):
+        for raw in (True, False):
+            with self.subTest(raw=raw):
+                sink = self.sink()
+                with self.sender(sink) as sender:
+                    self.send(sender, raw)
+                    sink.disconnect()
+                    self.send(sender, raw)
+                    self.send(sender, raw)
+                self.assertEqual(sink.received, 3)
+                self.assertEqual(sink.commands.count('EHLO'), 2)
+
+    @override_settings(MAILING_SMTP_BATCH_SIZE=2)
+    def test_reconnects_after_batch_size(self):
+        for raw in (True, False):
+            with self.subTest(raw=raw):
+                sink = self.sink()
+                with self.sender(sink) as sender:
+                    for _ in range(5):
+                        self.send(sender, raw)
+                self.assertEqual(sink.received, 5)
+                self.assertEqual(sink.commands.count('EHLO'), 3)
+                self.assertEqual(sink.commands.count('QUIT'), 3)
+
+class PersonalizationTest(SimpleTestCase):
+    client_fields = {'full_name': 'Иван {0}', 'email': 'ivan@example.com', 'comment': ''}
+
+    def render(self, text):
+        return compile_template(text).render(Client(**self.client_fields))
+
+    def test_substitutes_client_fields(self):
+        self.assertEqual(self.render('{{ full_name }} <{{email}}>'), 'Иван {0} <ivan@example.com>')
+        self.assertEqual(self.render('{{ full_name }}, {{ full_name }}!'), 'Иван {0}, Иван {0}!')
+        self.assertEqual(self.render('[{{ comment }}]'), '[]')
+
+    def test_leaves_unknown_placeholders_and_braces(self):
+        self.assertEqual(self.render('{{ owner }} {{ full name }}'), '{{ owner }} {{ full name }}')
+        self.assertEqual(self.render('{0} {x} {{ {} }}'), '{0} {x} {{ {} }}')
+        self.assertEqual(self.render('{{{ email }}}'), '{ivan@example.com}')
+
+    def test_empty_and_static_text(self):
+        self.assertEqual(self.render(''), '')
+        template = compile_template('Без подстановок {}')
+        self.assertTrue(template.is_static)
+        self.assertEqual(template.render(None), 'Без подстановок {}')
+
+    def test_matches_regex_substitution(self):
+        client = Client(**self.client_fields)
+        texts = [
+            '', 'Текст', '{{ full_name }}', '{{full_name}}{{email}}', '{{ unknown }} {{ email }}',
+            '{{{ comment }}}', '}} {{ email', '{ {{ email }} }', '{{ email }}' * 3,
+        ]
+        for text in texts:
+            with self.subTest(text=text):
+                self.assertEqual(compile_template(text).render(client), substitute(text, client))
+
+
+class PreparedMessageTest(SimpleTestCase):
+    def test_headers_are_generated_per_recipient(self):
+        prepared = PreparedMessage('Тема', 'Текст')
+        with mock.patch('mailing_app.services.formatdate', return_value='Mon, 19 Oct 2026 10:00:00 -0000'):
+            first = message_from_bytes(prepared.for_recipient('a@example.com'))
+        second = message_from_bytes(prepared.for_recipient('b@example.com'))
+        self.assertEqual(first.get_all('Date'), ['Mon, 19 Oct 2026 10:00:00 -0000'])
+        self.assertEqual(len(second.get_all('Date')), 1)
+        self.assertNotEqual(first['Date'], second['Date'])
+        self.assertNotEqual(first['Message-ID'], second['Message-ID'])
+        self.assertEqual(second['To'], 'b@example.com')
+
+
+class ClientImportTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(email='owner@example.com', username='owner')
+        Client.objects.create(email='Known@Example.com', full_name='Известный', owner=self.user)
+
+    def test_duplicates_ignore_case_and_imported_clients_are_listed(self):
+        result = import_clients(
+            ['email,full_name', 'known@example.com,Дубль', 'NEW@example.com,Новый', 'new@example.com,Дубль'],
+            self.user,
+        )
+        self.assertEqual((result.created, result.duplicates), (1, 2))
+        self.assertEqual(Client.objects.count(), 2)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('client_list'))
+        self.assertContains(response, 'new@example.com')
+        self.assertContains(response, 'Known@Example.com')
+
+
+class SuppressionTest(TestCase):
+    def setUp(self):
+        seed_mailings(2)
+        self.mailing = Mailing.objects.first()
+        self.target = self.mailing.clients.first()
+
+    def test_unsubscribed_client_is_suppressed(self):
+        url = reverse('client_unsubscribe', args=[self.target.pk])
+        self.client.force_login(Mailing.objects.last().owner)
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_login(self.mailing.owner)
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertRedirects(self.client.post(url), reverse('client_list'))
+
+        index = SuppressionIndex.load()
+        self.assertEqual(len(index), 1)
+        self.assertIn(self.target.email.upper(), index)
+        self.assertNotIn('other@example.com', index)
+        self.assertEqual(Suppression.objects.get().reason, 'Отписка')
+
+
+class MailingFormTest(TestCase):
+    def setUp(self):
+        seed_mailings(1, clients_per_mailing=4)
+        self.mailing = Mailing.objects.get()
+        self.ids = list(self.mailing.clients.order_by('id').values_list('id', flat=True))
+
+    def form(self, recipients):
+        return MailingForm({
+            'start_time': '2026-01-01T10:00', 'end_time': '2026-01-02T10:00', 'status': 'Создана',
+            'message': self.mailing.message_id, 'recipients': recipients,
+        }, instance=self.mailing, user=self.mailing.owner)
+
+    def test_save_sets_selected_clients(self):
+        form = self.form(f'{self.ids[0]}-{self.ids[1]}')
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertEqual(list(self.mailing.clients.order_by('id').values_list('id', flat=True)), self.ids[:2])
+
+    def test_save_m2m_sets_clients_after_commit_false(self):
+        form = self.form(str(self.ids[3]))
+        self.assertTrue(form.is_valid(), form.errors)
+        mailing = form.save(commit=False)
+        self.assertEqual(mailing.clients.count(), 4)
+        mailing.save()
+        form.save_m2m()
+        self.assertEqual(list(mailing.clients.values_list('id', flat=True)), [self.ids[3]])
+
+
+class SegmentTest(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create(email='owner@example.com', username='owner')
+        other = CustomUser.objects.create(email='other@example.com', username='other')
+        clients = {
+            'a@gmail.com': ('vip', self.owner), 'b@GMail.com': ('Клиент VIP', self.owner),
+            'c@mail.ru': ('vip', self.owner), 'd@gmail.com': ('', self.owner),
+            'e@notgmail.com': ('vip', self.owner), 'f@gmail.com': ('vip', other),
+        }
+        for email, (comment, owner) in clients.items():
+            Client.objects.create(email=email, full_name=email, comment=comment, owner=owner)
+        Client.objects.filter(email='d@gmail.com').update(created_at=timezone.now() - timedelta(days=30))
+
+    def emails(self, clients):
+        return sorted(client.email for client in clients)
+
+    def segment(self, **rules):
+        return Segment.objects.create(name='Сегмент', owner=self.owner, **rules)
+
+    def test_resolve_applies_every_rule_to_owner_clients(self):
+        self.assertEqual(self.emails(self.segment(email_domain='gmail.com').resolve()),
+                         ['a@gmail.com', 'b@GMail.com', 'd@gmail.com'])
+        self.assertEqual(self.emails(self.segment(email_domain='@gmail.com', comment_contains='VIP').resolve()),
+                         ['a@gmail.com', 'b@GMail.com'])
+        since = timezone.now() - timedelta(days=1)
+        self.assertEqual(self.emails(self.segment(email_domain='gmail.com', created_from=since).resolve()),
+                         ['a@gmail.com', 'b@GMail.com'])
+        self.assertEqual(self.emails(self.segment(created_to=since).resolve()), ['d@gmail.com'])
+        self.assertEqual(len(self.segment().resolve()), 5)
+
+    def test_send_mailing_reaches_only_segment_clients(self):
+        message = Message.objects.create(subject='Тема', body='Текст', owner=self.owner)
+        now = timezone.now()
+        mailing = Mailing.objects.create(
+            owner=self.owner, message=message, start_time=now, end_time=now + timedelta(days=1),
+            segment=self.segment(email_domain='gmail.com', comment_contains='vip'),
+        )
+        # Выбранные вручную клиенты при заданном сегменте не используются
+        mailing.clients.set(Client.objects.filter(email='c@mail.ru'))
+        # Сегмент вычисляется в момент отправки
+        Client.objects.create(email='g@gmail.com', full_name='Новый', comment='VIP', owner=self.owner)
+
+        call_command('send_mailing', mailing.pk, stdout=io.StringIO())
+
+        expected = ['a@gmail.com', 'b@GMail.com', 'g@gmail.com']
+        self.assertEqual(sorted(email for sent in mail.outbox for email in sent.to), expected)
+        self.assertEqual(self.emails(attempt.client for attempt in Attempt.objects.select_related('client')),
+                         expected)
+
+class LeaseKeeperTest(SimpleTestCase):
+    def keep(self, renew, seconds):
+        stop_event = threading.Event()
+        with LeaseKeeper(renew, stop_event, lease=0.3) as keeper:
+            stop_event.wait(seconds)
+        return keeper, stop_event
+
+    def test_transient_renew_error_is_retried(self):
+        errors = [OperationalError('gone')]
+
+        def renew():
+            if errors:
+                raise errors.pop()
+            return True
+
+        renew = mock.Mock(side_effect=renew)
+        keeper, stop_event = self.keep(renew, 0.45)
+        self.assertFalse(keeper.lost)
+        self.assertFalse(stop_event.is_set())
+        self.assertGreaterEqual(renew.call_count, 2)
+
+    def test_lease_is_lost_when_renew_keeps_failing(self):
+        keeper, stop_event = self.keep(mock.Mock(side_effect=OperationalError('gone')), 1)
+        self.assertTrue(keeper.lost)
+        self.assertTrue(stop_event.is_set())
+
+    def test_lease_is_lost_after_takeover(self):
+        keeper, stop_event = self.keep(mock.Mock(return_value=False), 1)
+        self.assertTrue(keeper.lost)
@@ -1,12 +1,14 @@
 from django.urls import path
 from .views import (
-    home_view,
+    home_view, client_import, client_search, client_unsubscribe,
     mailing_send, deactivate_mailing,
     user_list, block_user,
     ClientListView, ClientCreateView, ClientUpdateView, ClientDeleteView,
     MessageListView, MessageCreateView, MessageUpdateView, MessageDeleteView,
+    SegmentListView, SegmentCreateView, SegmentUpdateView, SegmentDeleteView,
     MailingListView, MailingCreateView, MailingUpdateView, MailingDeleteView,
-    AttemptListView, MailingReportView
+    AttemptListView, MailingReportView,
+    attempt_export, mailing_report_export,
 )
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.views import LogoutView
@@ -15,12 +17,19 @@ urlpatterns = [
     path('', home_view, name='home'),
     path('clients/', ClientListView.as_view(), name='client_list'),
     path('clients/create/', ClientCreateView.as_view(), name='client_create'),
+    path('clients/import/', client_import, name='client_import'),
+    path('clients/search/', client_search, name='client_search'),
     path('clients/<int:pk>/edit/', ClientUpdateView.as_view(), name='client_update'),
     path('clients/<int:pk>/delete/', ClientDeleteView.as_view(), name='client_delete'),
+    path('clients/<int:pk>/unsubscribe/', client_unsubscribe, name='client_unsubscribe'),
     path('messages/', MessageListView.as_view(), name='message_list'),
     path('messages/create/', MessageCreateView.as_view(), name='message_create'),
     path('messages/<int:pk>/edit/', MessageUpdateView.as_view(), name='message_edit'),
     path('messages/<int:pk>/delete/', MessageDeleteView.as_view(), name='message_delete'),
+    path('segments/', SegmentListView.as_view(), name='segment_list'),
+    path('segments/create/', SegmentCreateView.as_view(), name='segment_create'),
+    path('segments/<int:pk>/edit/', SegmentUpdateView.as_view(), name='segment_update'),
+    path('segments/<int:pk>/delete/', SegmentDeleteView.as_view(), name='segment_delete'),
     path('mailings/', MailingListView.as_view(), name='mailing_list'),
     path('mailings/create/', MailingCreateView.as_view(), name='mailing_create'),
     path('mailings/<int:pk>/edit/', MailingUpdateView.as_view(), name='mailing_update'),
@@ -33,5 +42,7 @@ urlpatterns = [
     path('users/', user_list, name='user_list'),
     path('users/<int:pk>/block/', block_user, name='block_user'),
     path('attempts/', AttemptListView.as_view(), name='attempt_list'),
+    path('attempts/export/', attempt_export, name='attempt_export'),
     path('reports/', MailingReportView.as_view(), name='mailing_report'),
+    path('reports/export/', mailing_report_export, name='mailing_report_export'),
 ]
@@ -1,40 +1,62 @@
+import io
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from django.http import HttpResponseForbidden
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.http import HttpResponseForbidden, JsonResponse
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
+from django.views.decorators.http import require_POST
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from users.models import CustomUser
-from django.db.models import Count
-from .models import Client, Message, Mailing, Attempt
-from .forms import ClientForm, MessageForm, MailingForm
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from .models import Client, Message, Mailing, Attempt, Segment
+from .forms import ClientForm, ClientImportForm, MessageForm, MailingForm, SegmentForm
+from .cache import cache_version
+from .exports import export_response
+from .imports import import_clients
+from .jobs import enqueue_mailing
+from .pagination import KeysetPaginationMixin, keyset_paginate
+from .stats import owner_totals, owner_daily_series
+from .suppression import suppress
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 @login_required
-@cache_page(60 * 5)
 def home_view(request):
-    user_mailings = Mailing.objects.filter(owner=request.user)
-    user_attempts = Attempt.objects.filter(mailing__in=user_mailings)
-
-    context = {
-        'successful_attempts': user_attempts.filter(status='Успешно').count(),
-        'failed_attempts': user_attempts.filter(status='Не успешно').count(),
-        'total_messages_sent': user_attempts.count(),
-    }
+    version = cache_version(request.user)
+
+    def user_stats():
+        totals = owner_totals(request.user)
+        return {
+            'successful_attempts': totals['success'],
+            'failed_attempts': totals['fail'],
+            'total_messages_sent': totals['total'],
+            'daily_stats': owner_daily_series(request.user),
+        }
+
+    context = cache.get_or_set(
+        f'home_stats:{request.user.pk}:{version}', user_stats, settings.MAILING_CACHE_TTL
+    )
     return render(request, 'mailing_app/home.html', context)
 
-class ClientListView(ListView):
+class ClientListView(KeysetPaginationMixin, ListView):
     model = Client
     template_name = 'mailing_app/client_list.html'
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'manager':
-            return Client.objects.all()
-        return Client.objects.filter(mailing__owner=user).distinct()
+            queryset = Client.objects.all()
+        else:
+            queryset = Client.objects.filter(owner=user)
+        mailing_id = self.request.GET.get('mailing')
+        if mailing_id and mailing_id.isdigit():
+            queryset = queryset.filter(mailing=mailing_id)
+        return queryset
 
 class ClientCreateView(LoginRequiredMixin, CreateView):
     model = Client
@@ -56,7 +78,8 @@ class ClientUpdateView(UpdateView):
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
         user = self.request.user
-        if user.role != 'manager' and not Mailing.objects.filter(clients=obj, owner=user).exists():
+        if (user.role != 'manager' and obj.owner_id != user.pk
+                and not Mailing.objects.filter(clients=obj, owner=user).exists()):
             raise PermissionDenied("Нет доступа")
         return obj
 
@@ -68,11 +91,58 @@ class ClientDeleteView(DeleteView):
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
         user = self.request.user
-        if user.role != 'manager' and not Mailing.objects.filter(clients=obj, owner=user).exists():
+        if (user.role != 'manager' and obj.owner_id != user.pk
+                and not Mailing.objects.filter(clients=obj, owner=user).exists()):
             raise PermissionDenied("Нет доступа")
         return obj
 
-class MessageListView(ListView):
+@login_required
+@require_POST
+def client_unsubscribe(request, pk):
+    """Записывает отписку клиента: на его адрес больше не уходит ни одна рассылка."""
+    client = get_object_or_404(Client, pk=pk)
+    user = request.user
+    if (user.role != 'manager' and client.owner_id != user.pk
+            and not Mailing.objects.filter(clients=client, owner=user).exists()):
+        return HttpResponseForbidden("Нет доступа")
+    suppress(client.email, comment=f'Отписан пользователем {user.email}')
+    messages.warning(request, f'{client.email} отписан от рассылок.')
+    return redirect('client_list')
+
+@login_required
+def client_import(request):
+    if request.method == 'POST':
+        form = ClientImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            lines = io.TextIOWrapper(form.cleaned_data['file'], encoding='utf-8-sig', newline='')
+            result = import_clients(lines, request.user)
+            messages.success(request, f'Импорт завершён. {result}')
+            return redirect('client_list')
+    else:
+        form = ClientImportForm()
+    return render(request, 'mailing_app/client_import.html', {'form': form})
+
+@login_required
+def client_search(request):
+    if request.user.role == 'manager':
+        queryset = Client.objects.all()
+    else:
+        queryset = Client.objects.filter(owner=request.user)
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = queryset.filter(Q(email__icontains=query) | Q(full_name__icontains=query))
+    page = keyset_paginate(
+        queryset.only('id', 'email', 'full_name'), ('id',), request.GET.get('after'), 20
+    )
+    return JsonResponse({
+        'results': [
+            {'id': client.pk, 'email': client.email, 'full_name': client.full_name}
+            for client in page
+        ],
+        'next': page.next_cursor,
+    })
+
+class MessageListView(KeysetPaginationMixin, ListView):
     model = Message
     template_name = 'mailing_app/message_list.html'
 
@@ -117,15 +187,83 @@ class MessageDeleteView(DeleteView):
             raise PermissionDenied("Нет доступа")
         return obj
 
-class MailingListView(ListView):
+class SegmentListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    model = Segment
+    template_name = 'mailing_app/segment_list.html'
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.role == 'manager':
+            return Segment.objects.all()
+        return Segment.objects.filter(owner=user)
+
+class SegmentCreateView(LoginRequiredMixin, CreateView):
+    model = Segment
+    form_class = SegmentForm
+    template_name = 'mailing_app/segment_form.html'
+    success_url = reverse_lazy('segment_list')
+
+    def form_valid(self, form):
+        form.instance.owner = self.request.user
+        return super().form_valid(form)
+
+class SegmentUpdateView(LoginRequiredMixin, UpdateView):
+    model = Segment
+    form_class = SegmentForm
+    template_name = 'mailing_app/segment_form.html'
+    success_url = reverse_lazy('segment_list')
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        user = self.request.user
+        if user.role != 'manager' and obj.owner != user:
+            raise PermissionDenied("Нет доступа")
+        return obj
+
+class SegmentDeleteView(LoginRequiredMixin, DeleteView):
+    model = Segment
+    template_name = 'mailing_app/segment_confirm_delete.html'
+    success_url = reverse_lazy('segment_list')
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        user = self.request.user
+        if user.role != 'manager' and obj.owner != user:
+            raise PermissionDenied("Нет доступа")
+        return obj
+
+class MailingListView(KeysetPaginationMixin, ListView):
     model = Mailing
     template_name = 'mailing_app/mailing_list.html'
 
     def get_queryset(self):
         user = self.request.user
         if user.role == 'manager':
-            return Mailing.objects.all()
-        return Mailing.objects.filter(owner=user)
+            queryset = Mailing.objects.all()
+        else:
+            queryset = Mailing.objects.filter(owner=user)
+        status = self.request.GET.get('status')
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset.select_related('message', 'segment').annotate(client_count=Count('clients'))
+
+    def paginate_queryset(self, queryset, page_size):
+        # Кешируется сама страница, а не разметка: при попадании в кеш
+        # запросы за рассылками не выполняются вовсе
+        user = self.request.user
+        key = make_template_fragment_key('mailing_list', [
+            user.pk, cache_version(user), self.request.GET.get('status'),
+            self.request.GET.get(self.cursor_kwarg),
+        ])
+        return cache.get_or_set(
+            key, lambda: super(MailingListView, self).paginate_queryset(queryset, page_size),
+            settings.MAILING_CACHE_TTL,
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['status_choices'] = Mailing.STATUS_CHOICES
+        return context
 
 class MailingCreateView(CreateView):
     model = Mailing
@@ -133,11 +271,12 @@ class MailingCreateView(CreateView):
     template_name = 'mailing_app/mailing_form.html'
     success_url = reverse_lazy('mailing_list')
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
     def form_valid(self, form):
         form.instance.owner = self.request.user
-        response = super().form_valid(form)
-        form.save_m2m()
-        return response
+        return super().form_valid(form)
 
 class MailingUpdateView(UpdateView):
     model = Mailing
@@ -145,6 +284,9 @@ class MailingUpdateView(UpdateView):
     template_name = 'mailing_app/mailing_form.html'
     success_url = reverse_lazy('mailing_list')
 
+    def get_form_kwargs(self):
+        return {**super().get_form_kwargs(), 'user': self.request.user}
+
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
         user = self.request.user
@@ -169,29 +311,8 @@ def mailing_send(request, pk):
     mailing = get_object_or_404(Mailing, pk=pk)
     if mailing.owner != request.user and request.user.role != 'manager':
         return HttpResponseForbidden("Нет доступа")
-    for client in mailing.clients.all():
-        try:
-            send_mail(
-                subject=mailing.message.subject,
-                message=mailing.message.body,
-                from_email='noreply@example.com',
-                recipient_list=[client.email],
-                fail_silently=False,
-            )
-            Attempt.objects.create(
-                mailing=mailing,
-                status='Успешно',
-                server_response='Письмо отправлено успешно'
-            )
-        except Exception as e:
-            Attempt.objects.create(
-                mailing=mailing,
-                status='Не успешно',
-                server_response=str(e)
-            )
-    mailing.status = 'Запущена'
-    mailing.save()
-    messages.success(request, 'Рассылка отправлена!')
+    enqueue_mailing(mailing)
+    messages.success(request, 'Рассылка поставлена в очередь на отправку!')
     return redirect('mailing_list')
 
 @login_required
@@ -208,8 +329,9 @@ def deactivate_mailing(request, pk):
 def user_list(request):
     if request.user.role != 'manager':
         return HttpResponseForbidden("Нет доступа")
-    users = CustomUser.objects.all()
-    return render(request, 'mailing_app/user_list.html', {'users': users})
+    page = keyset_paginate(CustomUser.objects.all(), ('id',), request.GET.get('after'), 50,
+                           before=request.GET.get('before'))
+    return render(request, 'mailing_app/user_list.html', {'users': page, 'page_obj': page})
 
 @login_required
 def block_user(request, pk):
@@ -220,36 +342,76 @@ def block_user(request, pk):
     user.save()
     return redirect('user_list')
 
-class AttemptListView(LoginRequiredMixin, ListView):
+def filter_attempts(request):
+    user = request.user
+    if user.role == 'manager':
+        queryset = Attempt.objects.all()
+    else:
+        queryset = Attempt.objects.filter(mailing__owner=user)
+    mailing_id = request.GET.get('mailing')
+    if mailing_id and mailing_id.isdigit():
+        queryset = queryset.filter(mailing=mailing_id)
+    status = request.GET.get('status')
+    if status:
+        queryset = queryset.filter(status=status)
+    return queryset
+
+class AttemptListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Attempt
     template_name = 'mailing_app/attempt_list.html'
+    keyset_ordering = ('-timestamp', '-id')
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'manager':
-            return Attempt.objects.all()
-        return Attempt.objects.filter(mailing__owner=user)
+        return filter_attempts(self.request).select_related('mailing__message')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['status_choices'] = Attempt.STATUS_CHOICES
+        return context
+
+def mailing_report_queryset(user):
+    if user.role == 'manager':
+        queryset = Mailing.objects.all()
+    else:
+        queryset = Mailing.objects.filter(owner=user)
+    # Итоги берутся из дневной статистики, чтобы в них оставались и
+    # заархивированные попытки.
+    return queryset.annotate(
+        success=Coalesce(Sum('daily_stats__success_count'), 0),
+        fail=Coalesce(Sum('daily_stats__fail_count'), 0),
+        total=F('success') + F('fail'),
+    ).order_by('pk')
 
 class MailingReportView(LoginRequiredMixin, ListView):
     model = Mailing
     template_name = 'mailing_app/mailing_report.html'
 
     def get_queryset(self):
-        user = self.request.user
-        if user.role == 'manager':
-            return Mailing.objects.all()
-        return Mailing.objects.filter(owner=user)
+        return mailing_report_queryset(self.request.user).select_related('message', 'owner')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        report = []
-        for mailing in context['object_list']:
-            attempts = Attempt.objects.filter(mailing=mailing)
-            report.append({
+        context['report'] = [
+            {
                 'mailing': mailing,
-                'total': attempts.count(),
-                'success': attempts.filter(status='Успешно').count(),
-                'fail': attempts.filter(status='Не успешно').count(),
-            })
-        context['report'] = report
+                'total': mailing.total,
+                'success': mailing.success,
+                'fail': mailing.fail,
+            }
+            for mailing in context['object_list']
+        ]
         return context
+
+@login_required
+def attempt_export(request):
+    fields = ('id', 'mailing_id', 'mailing__message__subject', 'client__email',
+              'status', 'timestamp', 'server_response')
+    return export_response(filter_attempts(request).order_by('id'), fields,
+                           'attempts', request.GET.get('format'))
+
+@login_required
+def mailing_report_export(request):
+    fields = ('id', 'message__subject', 'status', 'start_time', 'end_time',
+              'total', 'success', 'fail')
+    return export_response(mailing_report_queryset(request.user), fields,
+                           'mailing_report', request.GET.get('format'))
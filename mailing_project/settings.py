@@ -139,6 +139,53 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Сколько писем отправлять через одно SMTP-соединение перед переподключением
+MAILING_SMTP_BATCH_SIZE = int(os.getenv('MAILING_SMTP_BATCH_SIZE') or 100)
+# Повторы после временных ошибок SMTP: пауза удваивается от BASE до MAX секунд
+MAILING_RETRY_BASE_DELAY = int(os.getenv('MAILING_RETRY_BASE_DELAY') or 60)
+MAILING_RETRY_MAX_DELAY = int(os.getenv('MAILING_RETRY_MAX_DELAY') or 60 * 60)
+MAILING_RETRY_MAX_ATTEMPTS = int(os.getenv('MAILING_RETRY_MAX_ATTEMPTS') or 5)
+# Сколько записей очереди повторов обработчик забирает за раз
+MAILING_RETRY_BATCH_SIZE = int(os.getenv('MAILING_RETRY_BATCH_SIZE') or 500)
+# Ограничение скорости отправки, писем в минуту (0 — без ограничения): на
+# учётную запись SMTP, на домен получателя по умолчанию и для отдельных
+# доменов в виде "gmail.com=600,mail.ru=300". Корзины жетонов общие для
+# всех процессов через Redis по MAILING_RATE_LIMIT_REDIS_URL (по умолчанию
+# REDIS_URL), без него — свои в каждом процессе
+MAILING_RATE_LIMIT_ACCOUNT = int(os.getenv('MAILING_RATE_LIMIT_ACCOUNT') or 0)
+MAILING_RATE_LIMIT_DOMAIN = int(os.getenv('MAILING_RATE_LIMIT_DOMAIN') or 0)
+MAILING_RATE_LIMIT_REDIS_URL = os.getenv('MAILING_RATE_LIMIT_REDIS_URL') or os.getenv('REDIS_URL')
+MAILING_RATE_LIMIT_DOMAINS = {
+    domain.strip().lower(): int(limit)
+    for domain, _, limit in (
+        item.partition('=') for item in os.getenv('MAILING_RATE_LIMIT_DOMAINS', '').split(',')
+    )
+    if domain.strip()
+}
+# Сколько секунд лимита можно израсходовать разом и сколько писем
+# запрашивать у ограничителя за одно обращение
+MAILING_RATE_LIMIT_BURST = int(os.getenv('MAILING_RATE_LIMIT_BURST') or 10)
+MAILING_RATE_LIMIT_BATCH = int(os.getenv('MAILING_RATE_LIMIT_BATCH') or 20)
+# Сколько клиентов в одном шарде рассылки и на сколько секунд обработчик
+# арендует шард (аренда продлевается, пока идёт отправка)
+MAILING_SHARD_SIZE = int(os.getenv('MAILING_SHARD_SIZE') or 10000)
+MAILING_SHARD_LEASE = int(os.getenv('MAILING_SHARD_LEASE') or 60)
+# На сколько секунд обработчик арендует задачу очереди рассылок
+MAILING_JOB_LEASE = int(os.getenv('MAILING_JOB_LEASE') or 60)
+# На сколько секунд планировщик захватывает наступившую рассылку
+MAILING_SCHEDULER_LEASE = int(os.getenv('MAILING_SCHEDULER_LEASE') or 60)
+# Сколько SMTP-соединений держит асинхронная отправка
+MAILING_ASYNC_POOL_SIZE = int(os.getenv('MAILING_ASYNC_POOL_SIZE') or 10)
+# Сколько попыток рассылки накапливать перед записью в базу одним INSERT
+MAILING_ATTEMPT_CHUNK_SIZE = int(os.getenv('MAILING_ATTEMPT_CHUNK_SIZE') or 500)
+# Сколько клиентов вставлять одним INSERT при импорте из CSV
+MAILING_IMPORT_CHUNK_SIZE = int(os.getenv('MAILING_IMPORT_CHUNK_SIZE') or 2000)
+# Сколько строк читать из базы за раз при потоковой выгрузке
+MAILING_EXPORT_CHUNK_SIZE = int(os.getenv('MAILING_EXPORT_CHUNK_SIZE') or 2000)
+# Куда и какими пачками archive_attempts переносит старые попытки
+MAILING_ARCHIVE_DIR = os.getenv('MAILING_ARCHIVE_DIR') or BASE_DIR / 'archive'
+MAILING_ARCHIVE_CHUNK_SIZE = int(os.getenv('MAILING_ARCHIVE_CHUNK_SIZE') or 5000)
+
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'login'
 
@@ -154,5 +201,9 @@ if CACHE_ENABLED:
         }
     }
 
+# Ключи кеша версионируются и сбрасываются сигналами моделей, поэтому срок
+# жизни может быть долгим
+MAILING_CACHE_TTL = int(os.getenv('MAILING_CACHE_TTL') or 60 * 60 * 24)
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file